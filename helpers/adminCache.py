@@ -0,0 +1,63 @@
+import time
+
+from telegram import ChatMember
+
+from helpers.singleFlight import SingleFlight
+
+# Per-chat set of administrator ids, loaded with get_chat_administrators and
+# kept fresh by chat_member updates and a TTL. Permission checks are a local
+# set lookup; a user missing from a fresh set forces one refresh (rate limited
+# by `miss_refresh_interval`) so newly promoted admins aren't locked out.
+
+ADMIN_STATUSES = (ChatMember.OWNER, ChatMember.ADMINISTRATOR)
+
+
+class AdminCache:
+    def __init__(self, ttl=600, miss_refresh_interval=30):
+        self.ttl = ttl
+        self.miss_refresh_interval = miss_refresh_interval
+        self._admins = {}  # chat id -> (set of user ids, loaded_at)
+        self._loads = SingleFlight()
+
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    async def is_admin(self, bot, chat_id, user_id):
+        entry = self._admins.get(chat_id)
+        if entry is not None:
+            admins, loaded_at = entry
+            age = time.monotonic() - loaded_at
+            if age < self.ttl and (user_id in admins or age < self.miss_refresh_interval):
+                self.hits += 1
+                return user_id in admins
+
+        self.misses += 1
+        admins = await self._loads.do(chat_id, lambda: self._load(bot, chat_id))
+        return user_id in admins
+
+    async def _load(self, bot, chat_id):
+        self.refreshes += 1
+        administrators = await bot.get_chat_administrators(chat_id)
+        admins = {member.user.id for member in administrators}
+        self._admins[chat_id] = (admins, time.monotonic())
+        return admins
+
+    def apply_chat_member_update(self, chat_member_update):
+        # Promotions and demotions only touch chats that are already cached
+        entry = self._admins.get(chat_member_update.chat.id)
+        if entry is None:
+            return
+        user_id = chat_member_update.new_chat_member.user.id
+        if chat_member_update.new_chat_member.status in ADMIN_STATUSES:
+            entry[0].add(user_id)
+        else:
+            entry[0].discard(user_id)
+
+    def stats(self):
+        return {
+            'chats': len(self._admins),
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+        }
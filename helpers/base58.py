@@ -0,0 +1,25 @@
+# Base58 (Bitcoin alphabet) decoding for Solana addresses, without a dependency
+
+ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+_VALUES = {char: value for value, char in enumerate(ALPHABET)}
+
+PUBKEY_SIZE = 32
+
+
+def b58decode(text):
+    number = 0
+    for char in text:
+        try:
+            number = number * 58 + _VALUES[char]
+        except KeyError:
+            raise ValueError(f"Invalid base58 character {char!r}") from None
+    # Every leading '1' stands for a leading zero byte
+    leading_zeros = len(text) - len(text.lstrip('1'))
+    return b'\0' * leading_zeros + number.to_bytes((number.bit_length() + 7) // 8, 'big')
+
+
+def decode_pubkey(address):
+    key = b58decode(address)
+    if len(key) != PUBKEY_SIZE:
+        raise ValueError(f"{address!r} is not a {PUBKEY_SIZE}-byte public key")
+    return key
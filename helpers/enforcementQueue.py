@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+
+# Wallets whose group access has to be re-checked, e.g. after they sent away
+# an NFT of a gated collection. A wallet already waiting is not queued twice,
+# and a single worker processes them in order so enforcement never competes
+# with interactive traffic for more than one ban at a time.
+#
+# Each wallet carries a not-before time (unix seconds): it isn't checked
+# earlier, so Helius' index has caught up with the transfer that queued it.
+# Queuing a waiting wallet again only pushes that time back.
+#
+# The queue lives in memory: wallets still queued at shutdown are logged and
+# left to the next /validate sweep.
+
+
+class EnforcementQueue:
+    def __init__(self, max_pending=10000):
+        self.max_pending = max_pending
+        self._queue = asyncio.Queue()
+        self._not_before = {}  # wallet address -> earliest check time
+        self._worker_task = None
+        self._checking = None  # wallet address being enforced right now
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.processed = 0
+        self.errors = 0
+
+    def put(self, wallet_address, not_before=0.0):
+        if wallet_address in self._not_before:
+            self._not_before[wallet_address] = max(self._not_before[wallet_address], not_before)
+            return
+        if len(self._not_before) >= self.max_pending:
+            self.dropped += 1
+            logging.error(f"Enforcement queue full, dropping {wallet_address}")
+            return
+        self._not_before[wallet_address] = not_before
+        self._schedule(wallet_address, not_before)
+        self.enqueued += 1
+
+    def _schedule(self, wallet_address, not_before):
+        delay = not_before - time.time()
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, wallet_address)
+        else:
+            self._queue.put_nowait(wallet_address)
+
+    def start(self, enforce):
+        # `enforce` is a coroutine function taking one wallet address
+        self._worker_task = asyncio.ensure_future(self._run(enforce))
+
+    async def _run(self, enforce):
+        while True:
+            wallet_address = await self._queue.get()
+            not_before = self._not_before[wallet_address]
+            if not_before > time.time():
+                # Queued again by a later transfer while waiting
+                self._schedule(wallet_address, not_before)
+                continue
+            # Transfers arriving while this wallet is checked queue it again
+            del self._not_before[wallet_address]
+            self._checking = wallet_address
+            try:
+                await enforce(wallet_address)
+                self.processed += 1
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Enforcement for {wallet_address} failed: {e}")
+            finally:
+                self._checking = None
+
+    async def join(self):
+        # Waits until every queued wallet has been checked
+        while self._not_before or self._checking is not None:
+            await asyncio.sleep(0.05)
+
+    async def stop(self):
+        if self._worker_task is not None:
+            self._worker_task.cancel()
+            await asyncio.gather(self._worker_task, return_exceptions=True)
+        if self._not_before:
+            logging.warning(f"Leaving {len(self._not_before)} wallet(s) unenforced: {sorted(self._not_before)}")
+
+    def stats(self):
+        return {
+            'pending': len(self._not_before),
+            'enqueued': self.enqueued,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+        }
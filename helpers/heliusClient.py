@@ -0,0 +1,339 @@
+import asyncio
+import importlib.util
+import json
+import logging
+import time
+
+import httpx
+
+from helpers.singleFlight import SingleFlight
+
+HELIUS_RPC_URL = "https://mainnet.helius-rpc.com/"
+
+# HTTP/2 needs the optional `h2` package; fall back to HTTP/1.1 keep-alive without it
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+
+class HeliusError(Exception):
+    pass
+
+
+class BatchRejected(HeliusError):
+    pass
+
+
+# JSON-RPC "invalid request": what an endpoint without batch support answers
+# to an array body. Rate limits and server errors are transient instead.
+JSONRPC_INVALID_REQUEST = -32600
+TRANSIENT_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+class HeliusClient:
+    # One long-lived client per process so /fetch bursts reuse warm TLS connections
+    def __init__(self, api_key, max_connections=20, max_keepalive_connections=10,
+                 keepalive_expiry=30.0, timeout=15.0, connect_timeout=5.0, coalesce_window=0.0,
+                 batch_size=50, batch_concurrency=4, batch_retries=2, batch_retry_delay=0.5, batch_window=0.005):
+        # Identical concurrent JSON-RPC calls share one upstream request
+        self.single_flight = SingleFlight(window=coalesce_window)
+        self.batch_size = batch_size
+        self.batch_concurrency = batch_concurrency
+        self.batch_retries = batch_retries
+        self.batch_retry_delay = batch_retry_delay
+        self.batch_window = batch_window
+        # Shared by every verify_ownership call, so concurrent callers together
+        # never have more than batch_concurrency batches in flight
+        self._batch_semaphore = asyncio.Semaphore(batch_concurrency)
+        # Pairs collected during the batch window, sent together as one batch
+        self._queued_pairs = []
+        self._flush_handle = None
+        # Ownership pairs being verified -> future of the answer, shared by
+        # concurrent verify_ownership calls asking for the same pair
+        self._pairs_in_flight = {}
+        self._chunk_tasks = set()  # detached chunk verifications, referenced until done
+        # Cleared the first time the endpoint rejects a JSON-RPC batch
+        self._batches_supported = True
+
+        self.ownership_calls = 0
+        self.ownership_pairs = 0
+        self.ownership_seconds = 0.0
+        self.ownership_max_seconds = 0.0
+        self.unbatched_calls = 0
+        self.shared_pairs = 0
+        self.batch_retried = 0
+        self.failed_batch_items = 0
+        self._client = httpx.AsyncClient(
+            base_url=HELIUS_RPC_URL,
+            params={'api-key': api_key},
+            headers={'Content-Type': 'application/json'},
+            http2=HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        )
+
+    async def rpc(self, method, params):
+        key = (method, json.dumps(params, sort_keys=True))
+        return await self.single_flight.do(key, lambda: self._post(method, params))
+
+    async def _post(self, method, params):
+        payload = {
+            "jsonrpc": "2.0",
+            "id": "my-id",
+            "method": method,
+            "params": params
+        }
+        response = await self._client.post("", json=payload)
+        response_data = response.json()
+
+        # Check for errors in the response
+        if 'error' in response_data:
+            raise HeliusError(response_data['error']['message'])
+        return response_data.get('result', {})
+
+    async def _post_batch(self, calls):
+        # One JSON-RPC batch request; returns the results in call order. A call
+        # the endpoint answered with an error gets a HeliusError in its slot, so
+        # one failed item doesn't fail the rest of the batch
+        payload = [
+            {"jsonrpc": "2.0", "id": index, "method": method, "params": params}
+            for index, (method, params) in enumerate(calls)
+        ]
+        for attempt in range(self.batch_retries + 1):
+            response = await self._client.post("", json=payload)
+            if response.status_code not in TRANSIENT_STATUS_CODES or attempt == self.batch_retries:
+                break
+            self.batch_retried += 1
+            await asyncio.sleep(self.batch_retry_delay * 2 ** attempt)
+
+        try:
+            response_data = response.json()
+        except ValueError:
+            raise HeliusError(f"Batch request failed with HTTP {response.status_code}: body is not JSON") from None
+        if not isinstance(response_data, list):
+            error = (response_data.get('error') or {}) if isinstance(response_data, dict) else {}
+            if error.get('code') == JSONRPC_INVALID_REQUEST:
+                raise BatchRejected(error.get('message', 'Batch request rejected'))
+            raise HeliusError(f"Batch request failed with HTTP {response.status_code}: "
+                              f"{error.get('message', 'unexpected response')}")
+
+        results = [None] * len(calls)
+        for item in response_data:
+            index = item.get('id') if isinstance(item, dict) else None
+            if type(index) is not int or not 0 <= index < len(calls):
+                raise HeliusError(f"Batch response has an item with unknown id {index!r}")
+            if 'error' in item:
+                error = item['error'] if isinstance(item['error'], dict) else {}
+                results[index] = HeliusError(error.get('message', 'Batch item failed'))
+            else:
+                results[index] = item.get('result', {})
+        if any(result is None for result in results):
+            raise HeliusError("Batch response is missing results")
+        return results
+
+    async def get_assets_by_owner(self, owner_address, page=1, limit=1000):
+        return await self.rpc("getAssetsByOwner", {
+            "ownerAddress": owner_address,
+            "page": page,
+            "limit": limit
+        })
+
+    async def get_asset(self, asset_id):
+        return await self.rpc("getAsset", {"id": asset_id})
+
+    async def get_asset_collection(self, asset_id):
+        # The collection address an asset is grouped under, or None
+        asset = await self.get_asset(asset_id)
+        for group in asset.get('grouping') or ():
+            if group.get('group_key') == 'collection':
+                return group.get('group_value')
+        return None
+
+    async def owns_collection(self, owner_address, collection_address):
+        # True if the wallet holds at least one asset of the collection
+        result = await self.rpc("searchAssets", {
+            "ownerAddress": owner_address,
+            "grouping": ["collection", collection_address],
+            "page": 1,
+            "limit": 1
+        })
+        return bool(result.get('items'))
+
+    async def get_assets_by_group(self, group_key, group_value, page=1, limit=1000):
+        return await self.rpc("getAssetsByGroup", {
+            "groupKey": group_key,
+            "groupValue": group_value,
+            "page": page,
+            "limit": limit
+        })
+
+    async def verify_ownership(self, pairs):
+        # Takes (wallet, collection) pairs and returns {(wallet, collection): bool}.
+        # Duplicates are checked once, and pairs another call is already
+        # verifying share its answer, the way single_flight coalesces rpc().
+        # The rest are queued for `batch_window` seconds, so the pairs of
+        # concurrent calls (a wave of join requests) are packed into the same
+        # JSON-RPC batches of searchAssets calls, sent with bounded concurrency.
+        loop = asyncio.get_running_loop()
+        futures = {}
+        to_verify = []
+        for pair in dict.fromkeys(pairs):
+            future = self._pairs_in_flight.get(pair)
+            if future is not None:
+                self.shared_pairs += 1
+            else:
+                future = self._pairs_in_flight[pair] = loop.create_future()
+                to_verify.append(pair)
+            futures[pair] = future
+
+        self._queued_pairs.extend(to_verify)
+        while len(self._queued_pairs) >= self.batch_size:
+            self._start_chunk(self._queued_pairs[:self.batch_size])
+            del self._queued_pairs[:self.batch_size]
+        if self._queued_pairs:
+            if self.batch_window <= 0:
+                self._flush_queued_pairs()
+            elif self._flush_handle is None:
+                self._flush_handle = loop.call_later(self.batch_window, self._flush_queued_pairs)
+
+        # Shielded so one caller giving up doesn't cancel the answer for the others
+        return {pair: await asyncio.shield(future) for pair, future in futures.items()}
+
+    def _flush_queued_pairs(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._queued_pairs:
+            self._start_chunk(self._queued_pairs)
+            self._queued_pairs = []
+
+    def _start_chunk(self, chunk):
+        # Detached from the callers: several calls may be waiting on these pairs,
+        # so one of them being cancelled must not cancel or fail the verification
+        task = asyncio.ensure_future(self._resolve_chunk(chunk, [self._pairs_in_flight[pair] for pair in chunk]))
+        self._chunk_tasks.add(task)
+        task.add_done_callback(self._chunk_tasks.discard)
+
+    async def _resolve_chunk(self, chunk, futures):
+        # Verifies one chunk and settles the future of each pair with its answer or its own error
+        try:
+            async with self._batch_semaphore:
+                started = time.monotonic()
+                owned = await self._verify_chunk(chunk)
+                elapsed = time.monotonic() - started
+        except BaseException as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e if isinstance(e, Exception) else HeliusError("Verification cancelled"))
+                    # Retrieved here so callers that gave up don't leave it unobserved
+                    future.exception()
+            if not isinstance(e, Exception):
+                raise
+        else:
+            self.ownership_calls += 1
+            self.ownership_pairs += len(chunk)
+            self.ownership_seconds += elapsed
+            self.ownership_max_seconds = max(self.ownership_max_seconds, elapsed)
+            for future, held in zip(futures, owned):
+                if isinstance(held, BaseException):
+                    future.set_exception(held if isinstance(held, Exception) else HeliusError("Verification cancelled"))
+                    future.exception()
+                else:
+                    future.set_result(held)
+        finally:
+            for pair in chunk:
+                self._pairs_in_flight.pop(pair, None)
+
+    async def _verify_chunk(self, chunk):
+        if self._batches_supported:
+            calls = [
+                ("searchAssets", {
+                    "ownerAddress": owner_address,
+                    "grouping": ["collection", collection_address],
+                    "page": 1,
+                    "limit": 1
+                })
+                for owner_address, collection_address in chunk
+            ]
+            try:
+                results = await self._post_batch(calls)
+            except BatchRejected as e:
+                # Fall back to one call per pair from now on
+                self._batches_supported = False
+                logging.warning(f"Helius rejected a JSON-RPC batch, verifying pairs one by one: {e}")
+            else:
+                # Pairs whose item failed are retried on their own; a pair failing
+                # again fails only the calls waiting on that pair
+                owned = [result if isinstance(result, HeliusError) else bool(result.get('items')) for result in results]
+                failed = [index for index, held in enumerate(owned) if isinstance(held, HeliusError)]
+                if failed:
+                    self.failed_batch_items += len(failed)
+                    logging.warning(f"{len(failed)} of {len(chunk)} batched ownership checks failed, retrying "
+                                    f"them one by one: {owned[failed[0]]}")
+                    retried = await asyncio.gather(*(self.owns_collection(*chunk[index]) for index in failed),
+                                                   return_exceptions=True)
+                    for index, held in zip(failed, retried):
+                        owned[index] = held
+                return owned
+        self.unbatched_calls += len(chunk)
+        return await asyncio.gather(*(
+            self.owns_collection(owner_address, collection_address) for owner_address, collection_address in chunk
+        ), return_exceptions=True)
+
+    def ownership_stats(self):
+        return {
+            'calls': self.ownership_calls,
+            'pairs': self.ownership_pairs,
+            'avgCallMs': round(self.ownership_seconds / self.ownership_calls * 1000, 1) if self.ownership_calls else 0,
+            'maxCallMs': round(self.ownership_max_seconds * 1000, 1),
+            'batched': self._batches_supported,
+            'unbatchedPairs': self.unbatched_calls,
+            'sharedPairs': self.shared_pairs,
+            'retriedBatches': self.batch_retried,
+            'failedBatchItems': self.failed_batch_items,
+        }
+
+    async def iter_assets_by_owner(self, owner_address, limit=1000, prefetch=True):
+        async for item in self._iter_pages(
+                lambda page: self.get_assets_by_owner(owner_address, page, limit), limit, prefetch):
+            yield item
+
+    async def iter_assets_by_group(self, group_key, group_value, limit=1000, prefetch=True):
+        async for item in self._iter_pages(
+                lambda page: self.get_assets_by_group(group_key, group_value, page, limit), limit, prefetch):
+            yield item
+
+    async def _iter_pages(self, fetch_page, limit, prefetch):
+        # Yields every item of every page. A full page means there may be more,
+        # so with prefetch the next page is requested while the caller is still
+        # processing this one.
+        page = 1
+        next_page = None
+        try:
+            while page:
+                if next_page is None:
+                    result = await fetch_page(page)
+                else:
+                    result = await next_page
+                    next_page = None
+
+                items = result.get('items', [])
+                has_more = len(items) == limit
+                if has_more and prefetch:
+                    next_page = asyncio.ensure_future(fetch_page(page + 1))
+
+                for item in items:
+                    yield item
+                page = page + 1 if has_more else None
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def aclose(self):
+        self._flush_queued_pairs()
+        for task in self._chunk_tasks:
+            task.cancel()
+        await asyncio.gather(*self._chunk_tasks, return_exceptions=True)
+        await self._client.aclose()
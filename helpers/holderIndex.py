@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import time
+
+from helpers.base58 import decode_pubkey
+from helpers.holderSnapshot import HolderSnapshot, SnapshotError, write_snapshot
+from helpers.singleFlight import SingleFlight
+
+# Local index of the holders of every gated collection, built from full
+# snapshots (paginated getAssetsByGroup). Ownership checks become a local
+# lookup instead of one Helius call per wallet.
+#
+# Each collection's snapshot is a compact file in `snapshot_dir` (see
+# holderSnapshot), opened lazily on first use. Snapshots carry the time they
+# were taken, so every worker process sharing the directory agrees on their
+# age and picks up a fresher file written by another one. holds() only
+# answers for fresh snapshots and returns None otherwise, so callers can fall
+# back to a live Helius check.
+#
+# Transfers pushed by the Helius webhook are applied on top of the snapshots
+# as an in-memory overlay: the receiver becomes a holder, and the sender's
+# ownership becomes unknown (they may hold other assets of the collection)
+# until the next snapshot. The overlay belongs to the process that received
+# the webhook.
+
+# Helius' asset index lags the chain slightly, so a transfer is only assumed
+# to be in snapshots started this many seconds after it
+OVERLAY_INDEXING_LAG = 60
+
+
+class HolderIndex:
+    def __init__(self, snapshot_dir, max_age=900, page_limit=1000):
+        self.snapshot_dir = snapshot_dir
+        self.max_age = max_age
+        self.page_limit = page_limit
+        self._snapshots = {}  # collection address -> open HolderSnapshot
+        self._overlay = {}  # collection address -> {public key: (holds True/None, event time)}
+        self._refresh_lock = asyncio.Lock()
+        self._refreshes = SingleFlight()
+
+        self.lookups = 0
+        self.unanswered = 0
+        self.applied_transfers = 0
+        self.refreshes = 0
+        self.failed_refreshes = 0
+        self.last_refresh_seconds = 0.0
+
+    def _path(self, collection_address):
+        # Base58 addresses are safe file names
+        return os.path.join(self.snapshot_dir, f"{collection_address}.holders")
+
+    def _snapshot(self, collection_address):
+        snapshot = self._snapshots.get(collection_address)
+        if snapshot is None:
+            try:
+                snapshot = HolderSnapshot(self._path(collection_address))
+            except FileNotFoundError:
+                return None
+            except SnapshotError as e:
+                logging.error(f"Ignoring holder snapshot of {collection_address}: {e}")
+                return None
+            self._snapshots[collection_address] = snapshot
+        return snapshot
+
+    def _reopen(self, collection_address):
+        # Drops the open map so the next lookup sees the file currently on disk
+        snapshot = self._snapshots.pop(collection_address, None)
+        if snapshot is not None:
+            snapshot.close()
+        return self._snapshot(collection_address)
+
+    def _age(self, collection_address):
+        snapshot = self._snapshot(collection_address)
+        return float('inf') if snapshot is None else time.time() - snapshot.created_at
+
+    def is_fresh(self, collection_address):
+        return self._age(collection_address) < self.max_age
+
+    def holds(self, owner_address, collection_address):
+        # True/False from a fresh snapshot, None when the collection isn't
+        # indexed or a transfer made the owner's holdings unknown
+        self.lookups += 1
+        try:
+            key = decode_pubkey(owner_address)
+        except ValueError:
+            return False
+        overlay = self._overlay.get(collection_address)
+        if overlay and key in overlay:
+            held = overlay[key][0]
+        elif self.is_fresh(collection_address):
+            return key in self._snapshots[collection_address]
+        else:
+            held = None
+        if held is None:
+            self.unanswered += 1
+        return held
+
+    def apply_transfer(self, collection_address, from_wallet, to_wallet, event_time):
+        overlay = self._overlay.setdefault(collection_address, {})
+        for wallet, held in ((from_wallet, None), (to_wallet, True)):
+            if not wallet:
+                continue
+            try:
+                key = decode_pubkey(wallet)
+            except ValueError:
+                continue
+            # Webhook deliveries can arrive out of order
+            if key not in overlay or overlay[key][1] <= event_time:
+                overlay[key] = (held, event_time)
+        self.applied_transfers += 1
+
+    def _trim_overlay(self, collection_address, taken_at):
+        # Transfers well before the snapshot started are part of it
+        overlay = self._overlay.get(collection_address)
+        if overlay:
+            self._overlay[collection_address] = {
+                key: entry for key, entry in overlay.items() if entry[1] > taken_at - OVERLAY_INDEXING_LAG
+            }
+
+    async def snapshot(self, helius_client, collection_address):
+        # Raw public keys of every current owner; burnt assets have no holder
+        keys = set()
+        async for asset in helius_client.iter_assets_by_group('collection', collection_address, self.page_limit):
+            owner = (asset.get('ownership') or {}).get('owner')
+            if owner and not asset.get('burnt'):
+                try:
+                    keys.add(decode_pubkey(owner))
+                except ValueError:
+                    logging.warning(f"Skipping malformed owner {owner!r} in {collection_address}")
+        return keys
+
+    async def refresh(self, helius_client, collection_address):
+        # Concurrent refreshes of one collection (the background job and a
+        # /validate sweep) share a single snapshot
+        return await self._refreshes.do(collection_address, lambda: self._refresh(helius_client, collection_address))
+
+    async def _refresh(self, helius_client, collection_address):
+        # The snapshot is as old as its first page
+        taken_at = time.time()
+        started = time.monotonic()
+        try:
+            keys = await self.snapshot(helius_client, collection_address)
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            # Sorting and the fsync stay off the event loop
+            count = await asyncio.to_thread(write_snapshot, self._path(collection_address), keys, taken_at)
+        except Exception as e:
+            self.failed_refreshes += 1
+            logging.error(f"Holder snapshot of {collection_address} failed: {e}")
+            return False
+        self._reopen(collection_address)
+        self._trim_overlay(collection_address, taken_at)
+        self.refreshes += 1
+        self.last_refresh_seconds = time.monotonic() - started
+        logging.info(f"Holder snapshot of {collection_address}: {count} owner(s) "
+                     f"in {self.last_refresh_seconds:.1f}s")
+        return True
+
+    async def ensure_fresh(self, helius_client, collection_address, refresh_before=0):
+        # Another worker may already have written a newer file; only snapshot
+        # the collection again if the one on disk is too old too
+        if self._age(collection_address) < self.max_age - refresh_before:
+            return True
+        snapshot = self._reopen(collection_address)
+        if self._age(collection_address) < self.max_age - refresh_before:
+            self._trim_overlay(collection_address, snapshot.created_at)
+            return True
+        return await self.refresh(helius_client, collection_address)
+
+    def discard(self, collection_address):
+        # Processes that still map the file keep reading it until they reopen
+        snapshot = self._snapshots.pop(collection_address, None)
+        if snapshot is not None:
+            snapshot.close()
+        self._overlay.pop(collection_address, None)
+        try:
+            os.remove(self._path(collection_address))
+        except FileNotFoundError:
+            pass
+
+    def _snapshot_files(self):
+        try:
+            names = os.listdir(self.snapshot_dir)
+        except FileNotFoundError:
+            return set()
+        return {name[:-len('.holders')] for name in names if name.endswith('.holders')}
+
+    async def refresh_stale(self, helius_client, collection_addresses, refresh_before=0):
+        # Refreshes, oldest first and one collection at a time, every snapshot
+        # older than max_age - refresh_before, and drops collections no longer
+        # gated. Overlapping calls are skipped rather than queued.
+        if self._refresh_lock.locked():
+            return
+        async with self._refresh_lock:
+            collection_addresses = set(collection_addresses)
+            for collection_address in (self._snapshot_files() | set(self._snapshots)) - collection_addresses:
+                self.discard(collection_address)
+
+            for collection_address in sorted(collection_addresses, key=self._age, reverse=True):
+                await self.ensure_fresh(helius_client, collection_address, refresh_before)
+
+    def stats(self):
+        return {
+            'openSnapshots': len(self._snapshots),
+            'freshSnapshots': sum(1 for address in list(self._snapshots) if self.is_fresh(address)),
+            'holders': sum(len(snapshot) for snapshot in self._snapshots.values()),
+            'overlayEntries': sum(len(overlay) for overlay in self._overlay.values()),
+            'appliedTransfers': self.applied_transfers,
+            'lookups': self.lookups,
+            'unanswered': self.unanswered,
+            'refreshes': self.refreshes,
+            'failedRefreshes': self.failed_refreshes,
+            'lastRefreshSeconds': round(self.last_refresh_seconds, 1),
+        }
@@ -0,0 +1,76 @@
+import mmap
+import os
+import struct
+
+from helpers.base58 import PUBKEY_SIZE
+
+# On-disk holder snapshot of one collection: a fixed header followed by the
+# owners' raw 32-byte public keys, sorted and deduplicated.
+#
+#   magic b'HLDR' | version u16 | key size u16 | count u64 | created_at f64 (unix time)
+#
+# Files are replaced atomically, so a reader always sees a complete snapshot,
+# and are read through a read-only mmap: pages are loaded on demand by the OS
+# and shared between every process that opens the same file.
+
+MAGIC = b'HLDR'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQd')
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def write_snapshot(path, keys, created_at):
+    keys = sorted(set(keys))
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, PUBKEY_SIZE, len(keys), created_at))
+            f.write(b''.join(keys))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return len(keys)
+
+
+class HolderSnapshot:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            # Checked before mapping: mmap refuses empty files with a plain ValueError
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                raise SnapshotError(f"{path} is too short for a holder snapshot")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, key_size, count, created_at = HEADER.unpack_from(self._map)
+        if magic != MAGIC or version != VERSION or key_size != PUBKEY_SIZE \
+                or len(self._map) != HEADER.size + count * key_size:
+            self.close()
+            raise SnapshotError(f"{path} is not a valid holder snapshot")
+        self.count = count
+        self.created_at = created_at
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key):
+        # Binary search over the sorted keys, reading them straight from the map
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = HEADER.size + mid * PUBKEY_SIZE
+            if self._map[offset:offset + PUBKEY_SIZE] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        offset = HEADER.size + lo * PUBKEY_SIZE
+        return lo < self.count and self._map[offset:offset + PUBKEY_SIZE] == key
+
+    def close(self):
+        self._map.close()
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+
+from pymongo import UpdateOne
+
+from helpers.mongoIndexes import USERNAME_COLLATION
+
+# Write-behind buffer for member-join updates. Joins are collected in memory
+# and written as one unordered bulk_write every `flush_interval` seconds, or
+# as soon as `max_events` joins are waiting. A user joining twice before a
+# flush is written once.
+#
+# Delivery is at-least-once: a failed flush puts its joins back in the buffer
+# (unless a newer event for the same user arrived meanwhile), and stop()
+# flushes whatever is left, retrying before giving up.
+
+
+class JoinWriteBuffer:
+    def __init__(self, collection, executor, max_events=200, flush_interval=0.3):
+        self.collection = collection
+        self._executor = executor
+        self.max_events = max_events
+        self.flush_interval = flush_interval
+        self._pending = {}  # (field, value) -> $set fields
+        self._flush_lock = asyncio.Lock()
+        self._loop_task = None
+        self._flush_tasks = set()  # size-triggered flushes, referenced until done
+
+        self.flushes = 0
+        self.flushed_events = 0
+        self.matched = 0
+        self.failed_flushes = 0
+        self.max_flush_size = 0
+        self.total_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    def add(self, username, user_id):
+        # By username when the user has one (matched case-insensitively, so
+        # the key is folded too), else by Telegram id
+        key = ('keyUsername', username.lower()) if username else ('keyTelegramId', user_id)
+        self._pending[key] = {'keyHasJoined': True, 'keyTelegramId': user_id}
+        if len(self._pending) >= self.max_events and not self._flush_lock.locked():
+            task = asyncio.ensure_future(self._flush_logged())
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+
+    def start(self):
+        self._loop_task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush_logged()
+
+    async def _flush_logged(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            logging.error(f"Join write-behind flush failed: {e}")
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            operations = [
+                UpdateOne({field: value}, {'$set': fields}, upsert=False,
+                          collation=USERNAME_COLLATION if field == 'keyUsername' else None)
+                for (field, value), fields in batch.items()
+            ]
+
+            started = time.monotonic()
+            try:
+                result = await self._executor.run(self.collection.bulk_write, operations, ordered=False)
+            except Exception:
+                self.failed_flushes += 1
+                # Newer events for the same user win over the ones being retried
+                self._pending = {**batch, **self._pending}
+                raise
+            elapsed = time.monotonic() - started
+
+            self.flushes += 1
+            self.flushed_events += len(operations)
+            self.matched += result.matched_count
+            self.max_flush_size = max(self.max_flush_size, len(operations))
+            self.total_flush_seconds += elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+            logging.info(f"Flushed {len(operations)} join(s), {result.matched_count} found in the database")
+
+    async def stop(self, retries=3):
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+        for attempt in range(retries):
+            try:
+                await self.flush()
+                return
+            except Exception as e:
+                logging.error(f"Final join flush failed (attempt {attempt + 1}/{retries}): {e}")
+        if self._pending:
+            logging.error(f"Dropping {len(self._pending)} unflushed join(s): {list(self._pending)}")
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'flushes': self.flushes,
+            'flushedEvents': self.flushed_events,
+            'matched': self.matched,
+            'failedFlushes': self.failed_flushes,
+            'avgFlushSize': round(self.flushed_events / self.flushes, 1) if self.flushes else 0,
+            'maxFlushSize': self.max_flush_size,
+            'avgFlushMs': round(self.total_flush_seconds / self.flushes * 1000, 1) if self.flushes else 0,
+            'maxFlushMs': round(self.max_flush_seconds * 1000, 1),
+        }
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import time
+
+from telegram.error import BadRequest, TelegramError
+
+from helpers.rateLimiter import PRIORITY_BULK
+
+# Bans members with bounded concurrency. Every ban goes through the bot's
+# outbound rate limiter as bulk traffic, so the per-group budget is respected
+# and admin replies in the same chat are not held up behind the sweep.
+
+
+async def ban_members(bot, chat_id, user_ids, concurrency=5, on_progress=None):
+    # Returns (removed, failed). `user_ids` may be any iterable; it is consumed
+    # lazily by the workers.
+    counts = {'removed': 0, 'failed': 0}
+    pending = iter(user_ids)
+
+    async def worker():
+        for user_id in pending:
+            try:
+                await bot.ban_chat_member(chat_id, user_id, rate_limit_args={'priority': PRIORITY_BULK})
+                counts['removed'] += 1
+            except TelegramError as e:
+                logging.error(f"Error removing user {user_id}: {e}")
+                counts['failed'] += 1
+            if on_progress:
+                await on_progress(counts['removed'], counts['failed'])
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return counts['removed'], counts['failed']
+
+
+class ProgressMessage:
+    # A single status message that is edited in place, at most once per `interval`.
+    # Addressed by ids so a job resumed in another process can keep editing it.
+    def __init__(self, bot, chat_id, message_id, interval=5.0):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.interval = interval
+        self._last_text = None
+        self._last_edit = time.monotonic()
+
+    async def update(self, text):
+        if time.monotonic() - self._last_edit >= self.interval:
+            await self._edit(text)
+
+    async def finish(self, text):
+        await self._edit(text)
+
+    async def _edit(self, text):
+        if text == self._last_text:
+            return
+        self._last_edit = time.monotonic()
+        self._last_text = text
+        try:
+            await self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id)
+        except BadRequest as e:
+            logging.warning(f"Could not update progress message: {e}")
@@ -0,0 +1,23 @@
+# Telegram rejects messages over 4096 characters. MessageChunker collects
+# formatted blocks and hands back a full chunk as soon as the next block
+# would not fit, so replies can be sent while the rest is still being built.
+
+
+class MessageChunker:
+    def __init__(self, limit=4000):
+        self.limit = limit
+        self._buffer = ""
+
+    def add(self, text):
+        # Returns a chunk that is ready to send, or None
+        ready = None
+        if self._buffer and len(self._buffer) + len(text) > self.limit:
+            ready = self._buffer
+            self._buffer = ""
+        self._buffer += text
+        return ready
+
+    def flush(self):
+        ready = self._buffer
+        self._buffer = ""
+        return ready or None
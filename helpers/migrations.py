@@ -0,0 +1,56 @@
+from pymongo import DeleteMany, UpdateOne
+
+# One-shot data migrations, run from the command line (see CLI_COMMANDS in main.py)
+
+
+def migrate_timestamps(groups_collection):
+    # keyTimestamp used to be stored as str(epoch seconds). Converts every such
+    # value to a BSON date in one server-side update; unparseable strings are
+    # left untouched.
+    seconds = {'$convert': {'input': '$keyTimestamp', 'to': 'double', 'onError': None, 'onNull': None}}
+    result = groups_collection.update_many(
+        {'keyTimestamp': {'$type': 'string'}},
+        [{'$set': {'keyTimestamp': {'$let': {
+            'vars': {'seconds': seconds},
+            'in': {'$cond': [
+                {'$eq': ['$$seconds', None]},
+                '$keyTimestamp',
+                {'$toDate': {'$multiply': ['$$seconds', 1000]}},
+            ]},
+        }}}}],
+    )
+    return result.modified_count
+
+
+def dedup_groups(groups_collection, batch_size=500):
+    # Collapses groups registered more than once for the same
+    # (keyChatId, keyCollectionAddress): the newest document keeps its config
+    # and inherits the oldest creation timestamp, the others are deleted.
+    pipeline = [
+        {'$sort': {'_id': 1}},
+        {'$group': {
+            '_id': {'chatId': '$keyChatId', 'collectionAddress': '$keyCollectionAddress'},
+            'ids': {'$push': '$_id'},
+            'firstTimestamp': {'$first': '$keyTimestamp'},
+            'count': {'$sum': 1},
+        }},
+        {'$match': {'count': {'$gt': 1}}},
+    ]
+
+    collapsed = 0
+    removed = 0
+    operations = []
+    for duplicate in groups_collection.aggregate(pipeline, allowDiskUse=True):
+        keep_id, stale_ids = duplicate['ids'][-1], duplicate['ids'][:-1]
+        operations.append(UpdateOne({'_id': keep_id}, {'$set': {'keyTimestamp': duplicate['firstTimestamp']}}))
+        operations.append(DeleteMany({'_id': {'$in': stale_ids}}))
+        collapsed += 1
+        removed += len(stale_ids)
+
+        if len(operations) >= batch_size:
+            groups_collection.bulk_write(operations, ordered=False)
+            operations = []
+
+    if operations:
+        groups_collection.bulk_write(operations, ordered=False)
+    return collapsed, removed
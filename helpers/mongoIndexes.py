@@ -0,0 +1,121 @@
+import logging
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.collation import Collation, CollationStrength
+from pymongo.errors import OperationFailure
+
+# Telegram usernames are case-insensitive. Queries on keyUsername must pass
+# this collation to match regardless of case and to use its index.
+USERNAME_COLLATION = Collation(locale='en', strength=CollationStrength.SECONDARY)
+
+# Indexes behind every query the bot runs. create_indexes is a no-op for
+# indexes that already exist with the same spec, so this is safe to run on
+# every startup.
+INDEXES = {
+    'groups': [
+        IndexModel([('keyCollectionAddress', ASCENDING), ('keyTimestamp', DESCENDING)],
+                   name='keyCollectionAddress_1_keyTimestamp_-1'),
+        IndexModel([('keyTimestamp', DESCENDING)], name='keyTimestamp_-1'),
+        IndexModel([('keyChatId', ASCENDING), ('keyCollectionAddress', ASCENDING)],
+                   name='keyChatId_1_keyCollectionAddress_1', unique=True),
+    ],
+    'users': [
+        IndexModel([('keyUsername', ASCENDING)], name='keyUsername_1_ci', collation=USERNAME_COLLATION),
+        IndexModel([('keyTelegramId', ASCENDING)], name='keyTelegramId_1'),
+        IndexModel([('keyWalletAddress', ASCENDING)], name='keyWalletAddress_1'),
+        IndexModel([('keyTgChatId', ASCENDING), ('keyHasTransacted', ASCENDING), ('_id', ASCENDING)],
+                   name='keyTgChatId_1_keyHasTransacted_1__id_1'),
+    ],
+    'validation_jobs': [
+        IndexModel([('keyChatId', ASCENDING)], name='keyChatId_1_active',
+                   unique=True, partialFilterExpression={'active': True}),
+        IndexModel([('active', ASCENDING), ('createdAt', ASCENDING)], name='active_1_createdAt_1'),
+    ],
+    'group_stats': [
+        IndexModel([('groupCount', DESCENDING)], name='groupCount_-1'),
+    ],
+}
+
+# Indexes replaced by the ones above (obsolete name -> replacement), dropped
+# when still present
+OBSOLETE_INDEXES = {
+    'groups': {
+        'keyCollectionAddress_1': 'keyCollectionAddress_1_keyTimestamp_-1',
+        'keyChatId_1': 'keyChatId_1_keyCollectionAddress_1',
+    },
+    'users': {
+        'keyUsername_1': 'keyUsername_1_ci',
+        'keyTgChatId_1_keyHasTransacted_1': 'keyTgChatId_1_keyHasTransacted_1__id_1',
+    },
+}
+
+# Representative shapes of the hot queries, checked with explain()
+HOT_QUERIES = [
+    ('groups', {'keyCollectionAddress': 'probe'}),
+    ('groups', {'keyChatId': 0, 'keyCollectionAddress': 'probe'}),
+    ('groups', {'keyTimestamp': {'$gte': datetime(2024, 1, 1)}}),
+    ('users', {'keyUsername': 'probe'}, USERNAME_COLLATION),
+    ('users', {'keyTelegramId': 0}),
+    ('users', {'keyWalletAddress': 'probe'}),
+    ('users', {'keyTgChatId': 0, 'keyHasTransacted': False}),
+]
+
+
+DUPLICATE_KEY_ERROR = 11000
+
+
+class QueryPlanError(RuntimeError):
+    pass
+
+
+def ensure_indexes(db):
+    # One index at a time, so a unique index blocked by existing duplicates
+    # doesn't prevent the others from being built
+    for collection_name, indexes in INDEXES.items():
+        for index in indexes:
+            try:
+                db[collection_name].create_indexes([index])
+            except OperationFailure as e:
+                if e.code != DUPLICATE_KEY_ERROR:
+                    raise
+                logging.error(f"Unique index {index.document['name']} on {collection_name} blocked by duplicates, "
+                              f"run `python main.py dedup-groups`: {e}")
+        logging.info(f"Indexes on {collection_name}: {', '.join(index.document['name'] for index in indexes)}")
+
+    # An obsolete index is only dropped once its replacement exists; the
+    # unique groups index, for one, fails to build until duplicates are gone
+    for collection_name, replacements in OBSOLETE_INDEXES.items():
+        existing = db[collection_name].index_information()
+        for name, replacement in replacements.items():
+            if name not in existing:
+                continue
+            if replacement not in existing:
+                logging.warning(f"Keeping obsolete index {name} on {collection_name} until {replacement} is built")
+                continue
+            db[collection_name].drop_index(name)
+            logging.info(f"Dropped obsolete index {name} on {collection_name}")
+
+
+def _plan_stages(plan):
+    # Collects every 'stage' in an explain() plan tree, whatever its nesting
+    if isinstance(plan, dict):
+        stages = [plan['stage']] if 'stage' in plan else []
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+        return stages
+    if isinstance(plan, list):
+        return [stage for item in plan for stage in _plan_stages(item)]
+    return []
+
+
+def check_query_plans(db):
+    for collection_name, query, *collation in HOT_QUERIES:
+        cursor = db[collection_name].find(query)
+        if collation:
+            cursor = cursor.collation(collation[0])
+        explained = cursor.explain()
+        stages = _plan_stages(explained['queryPlanner']['winningPlan'])
+        if 'COLLSCAN' in stages:
+            raise QueryPlanError(f"Query {query} on {collection_name} falls back to COLLSCAN")
+        logging.info(f"Query {query} on {collection_name} uses {' <- '.join(stages)}")
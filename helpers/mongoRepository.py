@@ -0,0 +1,325 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo import DeleteMany, ReplaceOne, ReturnDocument, UpdateOne
+
+from helpers.mongoIndexes import USERNAME_COLLATION
+
+# pymongo is synchronous, so every call is offloaded to a bounded thread pool.
+# Handlers await these methods and the event loop keeps dispatching updates
+# for other chats while a Mongo round-trip is in flight.
+
+
+class MongoExecutor:
+    def __init__(self, max_workers=8):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='mongo')
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+
+    async def iter_batches(self, make_cursor, batch_size=100):
+        # Streams a cursor in batches, each batch fetched off the event loop, so
+        # callers never hold the whole result set in memory
+        cursor = await self.run(make_cursor)
+        try:
+            while True:
+                batch = await self.run(lambda: list(itertools.islice(cursor, batch_size)))
+                if not batch:
+                    break
+                yield batch
+        finally:
+            await self.run(cursor.close)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
+
+
+class GroupRepository:
+    def __init__(self, collection, executor):
+        self.collection = collection
+        self._executor = executor
+
+    async def upsert_group(self, chat_id, collection_address, config, on_insert):
+        # Keyed on (keyChatId, keyCollectionAddress), backed by a unique index.
+        # Returns True when a new registration was created.
+        result = await self._executor.run(
+            self.collection.update_one,
+            {'keyChatId': chat_id, 'keyCollectionAddress': collection_address},
+            {'$set': config, '$setOnInsert': on_insert},
+            upsert=True,
+        )
+        return result.upserted_id is not None
+
+    async def iter_by_collection_address(self, collection_address, limit, batch_size=50):
+        # Newest first, capped at `limit` documents
+        projection = {'keyChatName': 1, 'keyGatingType': 1, 'keyTimestamp': 1}
+        make_cursor = lambda: (self.collection.find({'keyCollectionAddress': collection_address}, projection)
+                               .sort('keyTimestamp', -1).limit(limit).batch_size(batch_size))
+        async for batch in self._executor.iter_batches(make_cursor, batch_size):
+            for group in batch:
+                yield group
+
+    async def find_collection_addresses(self, chat_id):
+        groups = await self._executor.run(
+            lambda: list(self.collection.find({'keyChatId': chat_id}, {'keyCollectionAddress': 1}))
+        )
+        return [group['keyCollectionAddress'] for group in groups]
+
+    async def find_gated_collections(self):
+        # Every collection address some chat is gated on
+        return await self._executor.run(self.collection.distinct, 'keyCollectionAddress')
+
+    async def find_recent(self, limit=10):
+        projection = {'keyChatName': 1, 'keyCollectionAddress': 1, 'keyTimestamp': 1}
+        return await self._executor.run(
+            lambda: list(self.collection.find({}, projection).sort('keyTimestamp', -1).limit(limit))
+        )
+
+    async def count_created_since(self, since):
+        return await self._executor.run(self.collection.count_documents, {'keyTimestamp': {'$gte': since}})
+
+
+# Counters kept up to date at write time, so /stats reads a handful of
+# documents instead of scanning groups:
+#   {_id: 'global', totalGroups, byGatingType: {type: count}, latestCreatedAt}
+#   {_id: 'collection:<address>', keyCollectionAddress, groupCount, latestCreatedAt}
+GLOBAL_STATS_ID = 'global'
+
+
+def collection_stats_id(collection_address):
+    return f"collection:{collection_address}"
+
+
+class GroupStatsRepository:
+    def __init__(self, collection, groups_collection, executor):
+        self.collection = collection
+        self.groups_collection = groups_collection
+        self._executor = executor
+
+    async def record_group_created(self, collection_address, gating_type, created_at):
+        await self._record(collection_address, gating_type, 1, created_at)
+
+    async def record_group_removed(self, collection_address, gating_type):
+        await self._record(collection_address, gating_type, -1, None)
+
+    async def _record(self, collection_address, gating_type, delta, created_at):
+        global_update = {'$inc': {'totalGroups': delta, f'byGatingType.{gating_type}': delta}}
+        collection_update = {
+            '$inc': {'groupCount': delta},
+            '$set': {'keyCollectionAddress': collection_address},
+        }
+        if created_at is not None:
+            global_update['$max'] = {'latestCreatedAt': created_at}
+            collection_update['$max'] = {'latestCreatedAt': created_at}
+        await self._executor.run(self.collection.bulk_write, [
+            UpdateOne({'_id': GLOBAL_STATS_ID}, global_update, upsert=True),
+            UpdateOne({'_id': collection_stats_id(collection_address)}, collection_update, upsert=True),
+        ], ordered=False)
+
+    async def read_global(self):
+        return await self._executor.run(self.collection.find_one, {'_id': GLOBAL_STATS_ID})
+
+    async def read_collection(self, collection_address):
+        return await self._executor.run(self.collection.find_one, {'_id': collection_stats_id(collection_address)})
+
+    async def read_top_collections(self, limit=20):
+        return await self._executor.run(
+            lambda: list(self.collection.find({'groupCount': {'$gt': 0}}).sort('groupCount', -1).limit(limit))
+        )
+
+    async def compute_from_groups(self):
+        # Recomputes every counter document from the groups collection
+        created_at = {'$cond': [
+            {'$eq': [{'$type': '$keyTimestamp'}, 'string']},
+            {'$toDate': {'$multiply': [{'$toDouble': '$keyTimestamp'}, 1000]}},
+            '$keyTimestamp',
+        ]}
+        pipeline = [
+            {'$facet': {
+                'total': [{'$group': {'_id': None, 'count': {'$sum': 1}, 'latest': {'$max': created_at}}}],
+                'byCollection': [
+                    {'$group': {'_id': '$keyCollectionAddress', 'count': {'$sum': 1}, 'latest': {'$max': created_at}}},
+                ],
+                'byGatingType': [{'$group': {'_id': '$keyGatingType', 'count': {'$sum': 1}}}],
+            }},
+        ]
+        result = await self._executor.run(lambda: next(self.groups_collection.aggregate(pipeline)))
+        total = result['total'][0] if result['total'] else {'count': 0, 'latest': None}
+
+        documents = {GLOBAL_STATS_ID: {
+            '_id': GLOBAL_STATS_ID,
+            'totalGroups': total['count'],
+            'byGatingType': {row['_id']: row['count'] for row in result['byGatingType'] if row['_id']},
+            'latestCreatedAt': total['latest'],
+        }}
+        for row in result['byCollection']:
+            stats_id = collection_stats_id(row['_id'])
+            documents[stats_id] = {
+                '_id': stats_id,
+                'keyCollectionAddress': row['_id'],
+                'groupCount': row['count'],
+                'latestCreatedAt': row['latest'],
+            }
+        return documents
+
+    async def read_all(self):
+        return await self._executor.run(lambda: {doc['_id']: doc for doc in self.collection.find({})})
+
+    async def replace_all(self, documents):
+        # Upserts each recomputed document and drops counters that no longer exist
+        operations = [ReplaceOne({'_id': stats_id}, doc, upsert=True) for stats_id, doc in documents.items()]
+        operations.append(DeleteMany({'_id': {'$nin': list(documents)}}))
+        await self._executor.run(self.collection.bulk_write, operations, ordered=False)
+
+
+def diff_group_stats(live, recomputed):
+    # Lists (document id, field, live value, recomputed value) for every mismatch
+    differences = []
+    for stats_id in sorted(set(live) | set(recomputed)):
+        live_doc = live.get(stats_id, {})
+        new_doc = recomputed.get(stats_id, {})
+        for field in ('totalGroups', 'byGatingType', 'groupCount', 'latestCreatedAt'):
+            live_value, new_value = _normalize_stat(live_doc.get(field)), _normalize_stat(new_doc.get(field))
+            if live_value != new_value:
+                differences.append((stats_id, field, live_value, new_value))
+    return differences
+
+
+def _normalize_stat(value):
+    # Counters decremented back to zero are equivalent to missing ones
+    if isinstance(value, dict):
+        return {key: count for key, count in value.items() if count} or None
+    return value or None
+
+
+# Chat members, one document per user and chat. keyHasTransacted is set
+# outside this bot by the blink web app. Ownership checks also read
+# keyWalletAddress, which the bot never writes: until that flow records the
+# wallet the user transacted from, only transacted members can be verified.
+#   {keyTgChatId, keyUsername, keyTelegramId, keyHasJoined, keyHasTransacted,
+#    keyWalletAddress (optional, base58)}
+class UserRepository:
+    def __init__(self, collection, executor):
+        self.collection = collection
+        self._executor = executor
+
+    async def mark_joined(self, username, telegram_id):
+        # One atomic round-trip: matched by username (case-insensitive) when the
+        # user has one, else by Telegram id. Returns the matched _id or None.
+        if username:
+            query, collation = {'keyUsername': username}, USERNAME_COLLATION
+        else:
+            query, collation = {'keyTelegramId': telegram_id}, None
+        user = await self._executor.run(
+            self.collection.find_one_and_update,
+            query,
+            {'$set': {'keyHasJoined': True, 'keyTelegramId': telegram_id}},
+            projection={'_id': 1},
+            collation=collation,
+        )
+        return user['_id'] if user else None
+
+    async def find_member(self, chat_id, telegram_id, username=None):
+        # The user's record for this chat, by Telegram id or (case-insensitive) username
+        query = {'keyTgChatId': chat_id, 'keyTelegramId': telegram_id}
+        if username:
+            query = {'keyTgChatId': chat_id, '$or': [{'keyTelegramId': telegram_id}, {'keyUsername': username}]}
+        return await self._executor.run(
+            self.collection.find_one, query,
+            {'keyHasTransacted': 1, 'keyWalletAddress': 1},
+            collation=USERNAME_COLLATION if username else None,
+        )
+
+    async def find_by_wallet(self, wallet_address):
+        # Every chat membership recorded for the wallet
+        return await self._executor.run(
+            lambda: list(self.collection.find(
+                {'keyWalletAddress': wallet_address},
+                {'keyTgChatId': 1, 'keyTelegramId': 1, 'keyHasTransacted': 1, 'keyWalletAddress': 1},
+            ))
+        )
+
+    async def iter_non_transacted(self, chat_id, after_id=None, batch_size=100):
+        # Streams non-transacted users in _id order, resuming after `after_id`,
+        # as batches of {_id, keyTelegramId, keyWalletAddress} from a single indexed cursor
+        query = {'keyTgChatId': chat_id, 'keyHasTransacted': False}
+        if after_id is not None:
+            query['_id'] = {'$gt': after_id}
+        make_cursor = lambda: self.collection.find(query, {'keyTelegramId': 1, 'keyWalletAddress': 1}).sort('_id', 1).batch_size(batch_size)
+        async for batch in self._executor.iter_batches(make_cursor, batch_size):
+            yield batch
+
+
+# Validation sweeps persisted so they survive restarts. At most one active job
+# per chat (unique partial index on keyChatId where active is true); a worker
+# holds a job through a lease it extends at every checkpoint.
+#   {keyChatId, active, status: pending|running|done|failed, lastUserId,
+#    removed, failed, progressMessageId, worker, leaseUntil, createdAt, updatedAt}
+class ValidationJobRepository:
+    def __init__(self, collection, executor):
+        self.collection = collection
+        self._executor = executor
+
+    async def enqueue(self, chat_id, progress_message_id):
+        # Returns True if a new job was created, False if one is already active
+        now = datetime.now(timezone.utc)
+        result = await self._executor.run(
+            self.collection.update_one,
+            {'keyChatId': chat_id, 'active': True},
+            {'$setOnInsert': {
+                'status': 'pending',
+                'lastUserId': None,
+                'removed': 0,
+                'failed': 0,
+                'progressMessageId': progress_message_id,
+                'leaseUntil': None,
+                'createdAt': now,
+                'updatedAt': now,
+            }},
+            upsert=True,
+        )
+        return result.upserted_id is not None
+
+    async def claim(self, worker_id, lease_seconds):
+        # Takes the oldest active job that nobody holds a live lease on
+        now = datetime.now(timezone.utc)
+        return await self._executor.run(
+            self.collection.find_one_and_update,
+            {'active': True, '$or': [{'leaseUntil': None}, {'leaseUntil': {'$lt': now}}]},
+            {'$set': {
+                'status': 'running',
+                'worker': worker_id,
+                'leaseUntil': now + timedelta(seconds=lease_seconds),
+                'updatedAt': now,
+            }, '$inc': {'attempts': 1}},
+            sort=[('createdAt', 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def checkpoint(self, job_id, last_user_id, removed, failed, lease_seconds):
+        now = datetime.now(timezone.utc)
+        await self._executor.run(self.collection.update_one, {'_id': job_id}, {'$set': {
+            'lastUserId': last_user_id,
+            'removed': removed,
+            'failed': failed,
+            'leaseUntil': now + timedelta(seconds=lease_seconds),
+            'updatedAt': now,
+        }})
+
+    async def finish(self, job_id, status):
+        await self._executor.run(self.collection.update_one, {'_id': job_id}, {
+            '$set': {'status': status, 'leaseUntil': None, 'updatedAt': datetime.now(timezone.utc)},
+            '$unset': {'active': ''},
+        })
+
+    async def release(self, worker_id):
+        # Hands this worker's jobs back on shutdown so another process resumes them right away
+        await self._executor.run(
+            self.collection.update_many,
+            {'active': True, 'worker': worker_id},
+            {'$set': {'leaseUntil': None}},
+        )
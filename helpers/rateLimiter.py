@@ -0,0 +1,176 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+# Outbound Bot API rate limiting with priorities.
+#
+# Requests with a chat_id go through a global budget (~30 msg/s) and, for
+# messages to groups and channels, a per-chat budget (~20 msg/min). When a budget is
+# exhausted, waiting requests are released in priority order, so replies to
+# an admin's command overtake bulk output that is already queued.
+#
+# Pass the priority per call with
+#     context.bot.send_message(..., rate_limit_args={'priority': PRIORITY_BULK})
+# Requests without rate_limit_args are treated as interactive.
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# Telegram's per-group limit is about messages; moderation calls such as
+# banChatMember only count against the global budget
+GROUP_LIMITED_PREFIXES = ('send', 'copyMessage', 'forwardMessage', 'editMessage')
+
+
+class _PriorityBucket:
+    # Token bucket whose waiters are served lowest priority value first, then FIFO
+    _sequence = itertools.count()
+
+    def __init__(self, max_rate, time_period):
+        self.capacity = max_rate
+        self._tokens = float(max_rate)
+        self._fill_rate = max_rate / time_period
+        self._updated_at = time.monotonic()
+        self._waiters = []  # heap of (priority, sequence, future)
+        self._timer = None
+
+    @property
+    def queue_depth(self):
+        return len(self._waiters)
+
+    @property
+    def idle(self):
+        self._refill()
+        return not self._waiters and self._tokens >= self.capacity
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self._fill_rate)
+        self._updated_at = now
+
+    async def acquire(self, priority):
+        # Returns the number of seconds spent waiting for a token
+        self._refill()
+        if not self._waiters and self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._release()
+        started = time.monotonic()
+        await future
+        return time.monotonic() - started
+
+    def _on_timer(self):
+        self._timer = None
+        self._release()
+
+    def _release(self):
+        self._refill()
+        while self._waiters and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.cancelled():
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+
+        if self._waiters and self._timer is None:
+            delay = (1 - self._tokens) / self._fill_rate
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+
+class PriorityRateLimiter(BaseRateLimiter):
+    def __init__(self, overall_max_rate=30, overall_time_period=1, group_max_rate=20,
+                 group_time_period=60, max_retries=3):
+        self._overall = _PriorityBucket(overall_max_rate, overall_time_period)
+        self._group_max_rate = group_max_rate
+        self._group_time_period = group_time_period
+        self._group_buckets = {}
+        self._max_retries = max_retries
+        self._retry_after_event = asyncio.Event()
+        self._retry_after_event.set()
+
+        self.requests = 0
+        self.throttled_requests = 0
+        self.throttled_seconds = 0.0
+        self.retry_after_hits = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def _group_bucket(self, group_id):
+        # Drop idle buckets now and then so the dict doesn't grow with every chat seen
+        if len(self._group_buckets) > 512:
+            for key, bucket in list(self._group_buckets.items()):
+                if key != group_id and bucket.idle:
+                    del self._group_buckets[key]
+
+        if group_id not in self._group_buckets:
+            self._group_buckets[group_id] = _PriorityBucket(self._group_max_rate, self._group_time_period)
+        return self._group_buckets[group_id]
+
+    async def _throttle(self, group_id, priority):
+        waited = 0.0
+        if group_id is not None:
+            waited += await self._group_bucket(group_id).acquire(priority)
+        waited += await self._overall.acquire(priority)
+        if waited:
+            self.throttled_requests += 1
+            self.throttled_seconds += waited
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        rate_limit_args = rate_limit_args or {}
+        priority = rate_limit_args.get('priority', PRIORITY_INTERACTIVE)
+        max_retries = rate_limit_args.get('max_retries', self._max_retries)
+
+        chat_id = data.get('chat_id')
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        # Negative ids and @usernames are groups and channels
+        group_id = None
+        if ((isinstance(chat_id, int) and chat_id < 0) or isinstance(chat_id, str)) \
+                and endpoint.startswith(GROUP_LIMITED_PREFIXES):
+            group_id = chat_id
+
+        self.requests += 1
+        for attempt in range(max_retries + 1):
+            if chat_id is not None:
+                await self._throttle(group_id, priority)
+            await self._retry_after_event.wait()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                self.retry_after_hits += 1
+                if attempt == max_retries:
+                    logging.error(f"Rate limit hit on {endpoint} after {max_retries} retries")
+                    raise
+
+                # Telegram asked us to back off: pause every outbound request
+                sleep = e.retry_after + 0.1
+                logging.info(f"Rate limit hit on {endpoint}, retrying after {sleep} seconds")
+                self._retry_after_event.clear()
+                try:
+                    await asyncio.sleep(sleep)
+                finally:
+                    self._retry_after_event.set()
+                self.throttled_seconds += sleep
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'throttledRequests': self.throttled_requests,
+            'throttledSeconds': round(self.throttled_seconds, 2),
+            'retryAfterHits': self.retry_after_hits,
+            'overallQueueDepth': self._overall.queue_depth,
+            'groupQueueDepth': sum(bucket.queue_depth for bucket in self._group_buckets.values()),
+        }
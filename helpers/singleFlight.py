@@ -0,0 +1,49 @@
+import asyncio
+
+# Collapses concurrent identical calls into one: the first caller for a key
+# starts the work and everyone else arriving while it is in flight awaits the
+# same future. With `window` > 0 the finished result is also shared with
+# callers arriving up to `window` seconds after it completed.
+
+
+class SingleFlight:
+    def __init__(self, window=0.0):
+        self.window = window
+        self._futures = {}
+
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key, fn):
+        future = self._futures.get(key)
+        if future is not None:
+            self.shared += 1
+        else:
+            self.calls += 1
+            future = asyncio.ensure_future(fn())
+            self._futures[key] = future
+            future.add_done_callback(lambda done: self._on_done(key, done))
+
+        # Shielded so one caller giving up doesn't cancel the call for the others
+        return await asyncio.shield(future)
+
+    def _on_done(self, key, future):
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not future.cancelled():
+            future.exception()
+
+        if self.window > 0 and not future.cancelled() and future.exception() is None:
+            asyncio.get_running_loop().call_later(self.window, self._forget, key, future)
+        else:
+            self._forget(key, future)
+
+    def _forget(self, key, future):
+        if self._futures.get(key) is future:
+            del self._futures[key]
+
+    def stats(self):
+        return {
+            'inFlight': len(self._futures),
+            'upstreamCalls': self.calls,
+            'sharedCalls': self.shared,
+        }
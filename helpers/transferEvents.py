@@ -0,0 +1,37 @@
+from collections import namedtuple
+
+# NFT ownership changes extracted from Helius enhanced-transaction webhook
+# payloads (a JSON array of parsed transactions). Regular NFTs show up as
+# tokenTransfers of a non-fungible mint, compressed NFTs as COMPRESSED_NFT_*
+# events carrying the old and new leaf owner. Mints and burns have an empty
+# sender or receiver.
+
+NftTransfer = namedtuple('NftTransfer', ['signature', 'timestamp', 'asset_id', 'from_wallet', 'to_wallet'])
+
+NFT_TOKEN_STANDARDS = ('NonFungible', 'NonFungibleEdition', 'ProgrammableNonFungible')
+
+
+def extract_nft_transfers(transactions):
+    transfers = []
+    for transaction in transactions:
+        if transaction.get('transactionError'):
+            continue
+        signature = transaction.get('signature')
+        timestamp = transaction.get('timestamp') or 0
+
+        for token_transfer in transaction.get('tokenTransfers') or ():
+            if token_transfer.get('tokenStandard') not in NFT_TOKEN_STANDARDS or not token_transfer.get('mint'):
+                continue
+            transfers.append(NftTransfer(
+                signature, timestamp, token_transfer['mint'],
+                token_transfer.get('fromUserAccount') or None, token_transfer.get('toUserAccount') or None,
+            ))
+
+        for event in (transaction.get('events') or {}).get('compressed') or ():
+            if not event.get('assetId'):
+                continue
+            transfers.append(NftTransfer(
+                signature, timestamp, event['assetId'],
+                event.get('oldLeafOwner') or None, event.get('newLeafOwner') or None,
+            ))
+    return transfers
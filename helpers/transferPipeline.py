@@ -0,0 +1,41 @@
+import logging
+
+from helpers.holderIndex import OVERLAY_INDEXING_LAG
+from helpers.transferEvents import extract_nft_transfers
+
+# What a Helius transfer webhook delivery sets off: NFT transfers of gated
+# collections are applied to the holder index, and every sender is queued for
+# enforcement once Helius' index has had time to include the transfer (a
+# check made earlier could still report the seller as the owner).
+#
+# The collection lookup and the list of gated collections are passed in, so
+# the replay script can run the pipeline offline with recorded data.
+
+
+class TransferPipeline:
+    def __init__(self, holder_index, enforcement_queue, resolve_collection, load_gated_collections,
+                 enforcement_delay=OVERLAY_INDEXING_LAG):
+        self.holder_index = holder_index
+        self.enforcement_queue = enforcement_queue
+        self._resolve_collection = resolve_collection  # async asset id -> collection address or None
+        self._load_gated_collections = load_gated_collections  # async () -> collection addresses
+        self.enforcement_delay = enforcement_delay
+
+    async def process(self, transactions):
+        transfers = extract_nft_transfers(transactions)
+        if not transfers:
+            return {'transfers': 0, 'applied': 0}
+        gated_collections = set(await self._load_gated_collections())
+        applied = 0
+        for transfer in transfers:
+            collection_address = await self._resolve_collection(transfer.asset_id)
+            if collection_address not in gated_collections:
+                continue
+            self.holder_index.apply_transfer(
+                collection_address, transfer.from_wallet, transfer.to_wallet, transfer.timestamp)
+            if transfer.from_wallet:
+                self.enforcement_queue.put(transfer.from_wallet, not_before=transfer.timestamp + self.enforcement_delay)
+            applied += 1
+            logging.info(f"Transfer of {transfer.asset_id} ({collection_address}) from {transfer.from_wallet} "
+                         f"to {transfer.to_wallet} in {transfer.signature}")
+        return {'transfers': len(transfers), 'applied': applied}
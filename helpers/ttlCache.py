@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+# In-process LRU cache with TTL expiry and stale-while-revalidate.
+#
+# An entry is fresh for `ttl` seconds, then stale for another `stale_ttl`
+# seconds: stale entries are still served, and the caller is expected to
+# kick off a background refresh. After that the entry is dropped.
+# Size is bounded both by entry count and by an estimated byte size.
+
+
+class TTLCache:
+    def __init__(self, ttl=300, stale_ttl=900, max_entries=1024, max_bytes=16 * 1024 * 1024, sizeof=None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof or (lambda value: 0)
+        self._entries = OrderedDict()  # key -> (value, stored_at, size)
+        self._bytes = 0
+        self._refreshing = {}
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+
+    def get(self, key):
+        # Returns (value, is_stale), or None on a miss
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        value, stored_at, _ = entry
+        age = time.monotonic() - stored_at
+        if age > self.ttl + self.stale_ttl:
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        if age > self.ttl:
+            self.stale_hits += 1
+            return value, True
+        self.hits += 1
+        return value, False
+
+    def set(self, key, value):
+        if key in self._entries:
+            self._remove(key)
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, time.monotonic(), size)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def refresh(self, key, loader):
+        # Reload `key` in the background; concurrent refreshes of one key are collapsed
+        if key in self._refreshing:
+            return self._refreshing[key]
+        self.refreshes += 1
+        task = asyncio.ensure_future(self._run_refresh(key, loader))
+        self._refreshing[key] = task
+        return task
+
+    async def _run_refresh(self, key, loader):
+        try:
+            self.set(key, await loader())
+        except Exception as e:
+            logging.warning(f"Background refresh of {key} failed: {e}")
+        finally:
+            self._refreshing.pop(key, None)
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'staleHits': self.stale_hits,
+            'misses': self.misses,
+            'hitRatio': round((self.hits + self.stale_hits) / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+            'refreshes': self.refreshes,
+        }
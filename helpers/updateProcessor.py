@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import sys
+
+from telegram.ext import BaseUpdateProcessor
+
+# Processes updates from different chats concurrently while keeping the
+# updates of any single chat strictly in arrival order.
+#
+# With more than one concurrent update, PTB's Application starts a task for
+# every update it fetches; the base class semaphore only limits how many of
+# those tasks are inside do_process_update. Used as a cap, updates waiting on
+# one busy chat's lock could take every slot and stall all other chats, so it
+# is left unbounded and both limits are applied here instead:
+#   - concurrency: `max_concurrent_updates`, taken only once an update holds
+#     its chat's lock, so waiting updates never occupy a slot
+#   - memory: at most `max_pending_updates` updates waiting or running in
+#     total and `max_pending_per_chat` per chat; further updates are dropped
+#     and counted, so one flooding chat can't use up the global budget
+
+UNBOUNDED = sys.maxsize
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates, max_pending_updates=1024, max_pending_per_chat=256):
+        super().__init__(UNBOUNDED)
+        self.max_running_updates = max_concurrent_updates
+        self.max_pending_updates = max(max_pending_updates, max_concurrent_updates)
+        self.max_pending_per_chat = max_pending_per_chat
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._chat_locks = {}  # chat id -> [lock, number of updates holding or waiting for it]
+        self._pending = 0
+
+        self.dropped = 0
+
+    @staticmethod
+    def _chat_key(update):
+        chat = getattr(update, 'effective_chat', None)
+        return chat.id if chat else None
+
+    def _drop(self, update, coroutine, reason):
+        self.dropped += 1
+        # Never awaited, so close it to avoid a "coroutine was never awaited" warning
+        if hasattr(coroutine, 'close'):
+            coroutine.close()
+        if self.dropped % 100 == 1:
+            logging.warning(f"Dropping update {getattr(update, 'update_id', None)} ({reason}), "
+                            f"{self.dropped} dropped so far")
+
+    async def do_process_update(self, update, coroutine):
+        if self._pending >= self.max_pending_updates:
+            self._drop(update, coroutine, f"{self._pending} updates pending")
+            return
+        chat_id = self._chat_key(update)
+        entry = self._chat_locks.get(chat_id) if chat_id is not None else None
+        if entry is not None and entry[1] >= self.max_pending_per_chat:
+            self._drop(update, coroutine, f"{entry[1]} updates pending in chat {chat_id}")
+            return
+
+        self._pending += 1
+        try:
+            if chat_id is None:
+                async with self._running:
+                    await coroutine
+                return
+
+            entry = self._chat_locks.setdefault(chat_id, [asyncio.Lock(), 0])
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    async with self._running:
+                        await coroutine
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._chat_locks[chat_id]
+        finally:
+            self._pending -= 1
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self):
+        return {
+            'activeChats': len(self._chat_locks),
+            'pendingUpdates': self._pending,
+            'queuedUpdates': sum(users for _, users in self._chat_locks.values()),
+            'droppedUpdates': self.dropped,
+        }
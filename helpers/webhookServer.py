@@ -0,0 +1,95 @@
+import hmac
+import json
+import logging
+
+import tornado.httpserver
+import tornado.web
+from telegram import Update
+
+# The bot's single HTTP server. Hosting platforms route one port ($PORT) to
+# the service, so every webhook the bot receives is a route on this server:
+#
+#   - Telegram updates (webhook mode). Telegram sends the webhook's secret
+#     token in X-Telegram-Bot-Api-Secret-Token; updates go onto the
+#     application's update queue, like PTB's own webhook server does.
+#   - Helius enhanced-transaction webhooks. Helius sends the webhook's
+#     configured auth header value in Authorization with every POST. The body
+#     is a JSON array of transactions, handed to `on_transactions`, whose
+#     result is returned as the JSON response. A non-2xx response makes Helius
+#     retry the delivery.
+#
+# Requests without the expected secret are rejected.
+
+
+def _check_secret(request, header, expected):
+    provided = request.headers.get(header, '')
+    if not hmac.compare_digest(provided.encode(), expected.encode()):
+        raise tornado.web.HTTPError(403)
+
+
+def _json_body(request):
+    try:
+        return json.loads(request.body)
+    except ValueError:
+        raise tornado.web.HTTPError(400, reason="Body is not JSON")
+
+
+class TelegramWebhookHandler(tornado.web.RequestHandler):
+    def initialize(self, secret_token, bot_application):
+        # Not `application`: RequestHandler already uses that for the tornado app
+        self.secret_token = secret_token
+        self.bot_application = bot_application
+
+    async def post(self):
+        _check_secret(self.request, 'X-Telegram-Bot-Api-Secret-Token', self.secret_token)
+        update = Update.de_json(_json_body(self.request), self.bot_application.bot)
+        await self.bot_application.update_queue.put(update)
+
+
+class HeliusWebhookHandler(tornado.web.RequestHandler):
+    def initialize(self, auth_header, on_transactions):
+        self.auth_header = auth_header
+        self.on_transactions = on_transactions
+
+    async def post(self):
+        _check_secret(self.request, 'Authorization', self.auth_header)
+        transactions = _json_body(self.request)
+        if not isinstance(transactions, list):
+            raise tornado.web.HTTPError(400, reason="Expected a JSON array of transactions")
+
+        result = await self.on_transactions(transactions)
+        self.write(result)
+
+
+class WebhookServer:
+    def __init__(self, port, listen='0.0.0.0'):
+        self.port = port
+        self.listen = listen
+        self._app = tornado.web.Application()
+        self._paths = []
+        self._server = None
+
+    def _add_route(self, path, handler, kwargs):
+        path = f"/{path.strip('/')}"
+        self._app.add_handlers(r'.*', [(path, handler, kwargs)])
+        self._paths.append(path)
+
+    def add_telegram_route(self, path, secret_token, bot_application):
+        self._add_route(path, TelegramWebhookHandler,
+                        {'secret_token': secret_token, 'bot_application': bot_application})
+
+    def add_helius_route(self, path, auth_header, on_transactions):
+        self._add_route(path, HeliusWebhookHandler,
+                        {'auth_header': auth_header, 'on_transactions': on_transactions})
+
+    def start(self):
+        self._server = tornado.httpserver.HTTPServer(self._app, xheaders=True)
+        self._server.listen(self.port, address=self.listen)
+        logging.info(f"Webhook server listening on {self.listen}:{self.port} for {', '.join(self._paths)}")
+
+    async def stop(self):
+        # Safe to call twice: webhook mode stops taking updates before the application stops
+        if self._server is not None:
+            server, self._server = self._server, None
+            server.stop()
+            await server.close_all_connections()
@@ -1,12 +1,15 @@
-from datetime import datetime
+from datetime import datetime, timezone
 
-def utilXtimeAgo(timestamp_str):
+def utilXtimeAgo(timestamp):
 # helpers/time_utils.py
     try:
-        # Convert the timestamp string to a float
-        timestamp = float(timestamp_str)
-        now = datetime.now()
-        then = datetime.fromtimestamp(timestamp)
+        # Timestamps are BSON dates (naive UTC when read back from pymongo);
+        # older documents still hold the epoch seconds as a string
+        if isinstance(timestamp, datetime):
+            then = timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+        else:
+            then = datetime.fromtimestamp(float(timestamp), tz=timezone.utc)
+        now = datetime.now(timezone.utc)
         duration = now - then
 
         if duration.days > 365:
@@ -22,4 +25,4 @@ def utilXtimeAgo(timestamp_str):
         return f"{duration.seconds} seconds ago"
     except ValueError:
         # If conversion fails, return the original string
-        return f"Invalid timestamp: {timestamp_str}"
\ No newline at end of file
+        return f"Invalid timestamp: {timestamp}"
@@ -1,17 +1,35 @@
 import os
+import sys
+import asyncio
+import signal
+import socket
+from datetime import datetime, timedelta, timezone
 import certifi
 import urllib3
 urllib3.disable_warnings()
 from telegram import Update, ReplyKeyboardMarkup, Chat, BotCommand, ChatPermissions, ChatMember, InlineKeyboardButton, InlineKeyboardMarkup, WebAppInfo
-from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters, JobQueue, ChatMemberHandler
+from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters, JobQueue, ChatMemberHandler, TypeHandler, ChatJoinRequestHandler
 from pymongo import MongoClient
 from dotenv import load_dotenv
 import logging
 from helpers.xTimeago import utilXtimeAgo
 from telegram.constants import ParseMode
-from telegram.error import BadRequest
-import requests
 from helpers.utilUrlHelper import utilUrlEncode
+from helpers.mongoRepository import MongoExecutor, GroupRepository, UserRepository, GroupStatsRepository, ValidationJobRepository, diff_group_stats
+from helpers.heliusClient import HeliusClient, HeliusError
+from helpers.messageChunker import MessageChunker
+from helpers.ttlCache import TTLCache
+from helpers.mongoIndexes import ensure_indexes, check_query_plans
+from helpers.updateProcessor import PerChatUpdateProcessor
+from helpers.rateLimiter import PriorityRateLimiter, PRIORITY_BULK
+from helpers.adminCache import AdminCache
+from helpers.memberRemoval import ban_members, ProgressMessage
+from helpers.joinWriteBuffer import JoinWriteBuffer
+from helpers.migrations import dedup_groups, migrate_timestamps
+from helpers.holderIndex import HolderIndex
+from helpers.transferPipeline import TransferPipeline
+from helpers.enforcementQueue import EnforcementQueue
+from helpers.webhookServer import WebhookServer
 
 # Load environment variables
 load_dotenv()
@@ -28,10 +46,125 @@ db = client[os.getenv('ENV_MONGO_DB_NAME')]
 groups_collection = db['groups']
 users_collection = db['users']
 
+# All Mongo access from handlers goes through these repositories so that
+# database latency never blocks the event loop
+mongo_executor = MongoExecutor(max_workers=int(os.getenv('ENV_MONGO_MAX_WORKERS', '8')))
+groups_repo = GroupRepository(groups_collection, mongo_executor)
+users_repo = UserRepository(users_collection, mongo_executor)
+group_stats_repo = GroupStatsRepository(db['group_stats'], groups_collection, mongo_executor)
+validation_jobs_repo = ValidationJobRepository(db['validation_jobs'], mongo_executor)
+
+# Member joins are written behind in bulk; ENV_JOIN_WRITE_BEHIND=0 writes each join directly
+join_buffer = None
+if os.getenv('ENV_JOIN_WRITE_BEHIND', '1') == '1':
+    join_buffer = JoinWriteBuffer(
+        users_collection, mongo_executor,
+        max_events=int(os.getenv('ENV_JOIN_FLUSH_MAX_EVENTS', '200')),
+        flush_interval=float(os.getenv('ENV_JOIN_FLUSH_INTERVAL', '0.3')),
+    )
+
+# Process-wide Helius client, closed in post_shutdown
+helius_client = HeliusClient(
+    os.getenv('ENV_HELIUS_API_KEY'),
+    max_connections=int(os.getenv('ENV_HELIUS_MAX_CONNECTIONS', '20')),
+    max_keepalive_connections=int(os.getenv('ENV_HELIUS_MAX_KEEPALIVE', '10')),
+    timeout=float(os.getenv('ENV_HELIUS_TIMEOUT', '15')),
+    coalesce_window=float(os.getenv('ENV_HELIUS_COALESCE_WINDOW', '0')),
+    batch_size=int(os.getenv('ENV_HELIUS_BATCH_SIZE', '50')),
+    batch_concurrency=int(os.getenv('ENV_HELIUS_BATCH_CONCURRENCY', '4')),
+    batch_window=float(os.getenv('ENV_HELIUS_BATCH_WINDOW', '0.005')),
+)
+
+# Reduced (name, collection address) listings per wallet, so repeated /fetch
+# calls for the same wallet don't cost Helius credits
+assets_cache = TTLCache(
+    ttl=int(os.getenv('ENV_ASSETS_CACHE_TTL', '300')),
+    stale_ttl=int(os.getenv('ENV_ASSETS_CACHE_STALE_TTL', '900')),
+    max_entries=int(os.getenv('ENV_ASSETS_CACHE_MAX_ENTRIES', '1024')),
+    max_bytes=int(os.getenv('ENV_ASSETS_CACHE_MAX_BYTES', str(16 * 1024 * 1024))),
+    sizeof=lambda collections: sum(len(name) + len(address) + 64 for name, address in collections),
+)
+
+# Holder snapshots of every gated collection, refreshed in the background so
+# ownership checks on joins and in /validate are local lookups. Worker
+# processes on one host can share ENV_HOLDER_SNAPSHOT_DIR.
+HOLDER_REFRESH_INTERVAL = int(os.getenv('ENV_HOLDER_REFRESH_INTERVAL', '60'))
+holder_index = HolderIndex(
+    os.getenv('ENV_HOLDER_SNAPSHOT_DIR', 'holder_snapshots'),
+    max_age=int(os.getenv('ENV_HOLDER_MAX_AGE', '900')),
+    page_limit=int(os.getenv('ENV_HOLDER_PAGE_LIMIT', '1000')),
+)
+
+# NFT transfers pushed by a Helius enhanced-transaction webhook update the
+# holder index right away and queue sellers for enforcement. The endpoint is
+# served on $PORT, only when ENV_HELIUS_WEBHOOK_AUTH is set.
+HELIUS_WEBHOOK_AUTH = os.getenv('ENV_HELIUS_WEBHOOK_AUTH')
+HELIUS_WEBHOOK_PATH = os.getenv('ENV_HELIUS_WEBHOOK_PATH', 'helius')
+enforcement_queue = EnforcementQueue(max_pending=int(os.getenv('ENV_ENFORCEMENT_MAX_PENDING', '10000')))
+
+# Asset id -> collection address; an asset's collection doesn't change
+asset_collections_cache = TTLCache(
+    ttl=int(os.getenv('ENV_ASSET_COLLECTIONS_CACHE_TTL', '86400')),
+    stale_ttl=0,
+    max_entries=int(os.getenv('ENV_ASSET_COLLECTIONS_CACHE_MAX_ENTRIES', '100000')),
+)
+
 
 # Configure logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 
+# Only the update types the handlers consume; chat_member has to be requested explicitly
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CHAT_MEMBER, Update.CHAT_JOIN_REQUEST]
+
+# Update ingress: 'polling' (default, for development) or 'webhook'
+BOT_MODE = os.getenv('ENV_BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('ENV_WEBHOOK_URL')
+WEBHOOK_PATH = os.getenv('ENV_WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('ENV_WEBHOOK_SECRET')
+WEBHOOK_PORT = int(os.getenv('PORT', '8000'))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('ENV_WEBHOOK_MAX_CONNECTIONS', '40'))
+DROP_PENDING_UPDATES = os.getenv('ENV_DROP_PENDING_UPDATES', '0') == '1'
+if BOT_MODE not in ('polling', 'webhook'):
+    raise ValueError(f"ENV_BOT_MODE must be 'polling' or 'webhook', got {BOT_MODE!r}")
+if BOT_MODE == 'webhook' and (not WEBHOOK_URL or not WEBHOOK_SECRET):
+    raise ValueError("ENV_WEBHOOK_URL and ENV_WEBHOOK_SECRET must be set in webhook mode")
+
+# Telegram (webhook mode) and Helius webhooks share one HTTP server on $PORT,
+# the only port Koyeb and Procfile-based platforms route to the service
+web_server = None
+if BOT_MODE == 'webhook' or HELIUS_WEBHOOK_AUTH:
+    web_server = WebhookServer(port=WEBHOOK_PORT)
+if HELIUS_WEBHOOK_AUTH:
+    web_server.add_helius_route(
+        HELIUS_WEBHOOK_PATH,
+        auth_header=HELIUS_WEBHOOK_AUTH,
+        on_transactions=lambda transactions: transfer_pipeline.process(transactions),
+    )
+
+# Administrators per chat for /magic and /validate permission checks
+admin_cache = AdminCache(
+    ttl=int(os.getenv('ENV_ADMIN_CACHE_TTL', '600')),
+    miss_refresh_interval=int(os.getenv('ENV_ADMIN_CACHE_MISS_REFRESH', '30')),
+)
+
+# /validate sweep tuning
+VALIDATE_BAN_CONCURRENCY = int(os.getenv('ENV_VALIDATE_BAN_CONCURRENCY', '5'))
+VALIDATE_PROGRESS_INTERVAL = float(os.getenv('ENV_VALIDATE_PROGRESS_INTERVAL', '5'))
+VALIDATE_CHECKPOINT_EVERY = int(os.getenv('ENV_VALIDATE_CHECKPOINT_EVERY', '100'))
+VALIDATE_LEASE_SECONDS = int(os.getenv('ENV_VALIDATE_LEASE_SECONDS', '600'))
+VALIDATE_MAX_JOBS = int(os.getenv('ENV_VALIDATE_MAX_JOBS', '4'))
+VALIDATE_MAX_ATTEMPTS = int(os.getenv('ENV_VALIDATE_MAX_ATTEMPTS', '5'))
+VALIDATE_POLL_INTERVAL = int(os.getenv('ENV_VALIDATE_POLL_INTERVAL', '30'))
+
+# Validation jobs run by this process, and the id it holds their leases under
+VALIDATION_WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+running_validation_jobs = set()
+
+# /stats output bounds
+STATS_PAGE_LIMIT = int(os.getenv('ENV_STATS_PAGE_LIMIT', '50'))
+STATS_TOP_COLLECTIONS = int(os.getenv('ENV_STATS_TOP_COLLECTIONS', '20'))
+STATS_RECENT_LIMIT = int(os.getenv('ENV_STATS_RECENT_LIMIT', '10'))
+
 keyboard_layout = [['Make the group private'], ['/magic <walAddress>']]
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -78,6 +211,32 @@ async def make_group_private(update: Update, context: ContextTypes.DEFAULT_TYPE)
 # If a group is private, it won't have a username.
 # Define a function to fetch NFT collections for a wallet address
 
+async def send_bulk(context: ContextTypes.DEFAULT_TYPE, chat_id, text):
+    # Long listings yield to interactive replies in the outbound rate limiter
+    await context.bot.send_message(chat_id, text, rate_limit_args={'priority': PRIORITY_BULK})
+
+def reduce_asset(item):
+    # Returns (name, collection address), or None for items without a collection
+    name = item.get('content', {}).get('metadata', {}).get('name', 'Unnamed NFT')
+    group_value = next((group['group_value'] for group in item.get('grouping', []) if group.get('group_key') == 'collection'), None)
+    if not group_value:
+        return None
+    return name, group_value
+
+def format_nft(name, collection_address):
+    return (
+        f"Name: {name}\n"
+        f"Collection Address: {collection_address}\n\n"
+    )
+
+async def load_wallet_collections(wallet_address):
+    collections = []
+    async for item in helius_client.iter_assets_by_owner(wallet_address):
+        reduced = reduce_asset(item)
+        if reduced:
+            collections.append(reduced)
+    return collections
+
 # Define a function to fetch NFT collections for a wallet address
 async def fetch(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
@@ -90,66 +249,44 @@ async def fetch(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         wallet_address = ' '.join(args)
-        
-        # Define the API endpoint and your API key
-        api_key = os.getenv('ENV_HELIUS_API_KEY')  # Make sure to add your Helius API key to the environment variables
-        url = f"https://mainnet.helius-rpc.com/?api-key={api_key}"
-        
-        # Define the payload for the POST request
-        payload = {
-            "jsonrpc": "2.0",
-            "id": "my-id",
-            "method": "getAssetsByOwner",
-            "params": {
-                "ownerAddress": wallet_address,
-                "page": 1,
-                "limit": 1000
-            }
-        }
-        
-        # Make the API call
-        response = requests.post(url, json=payload, headers={'Content-Type': 'application/json'})
-        response_data = response.json()
-        
-        # Check for errors in the response
-        if 'error' in response_data:
-            await update.message.reply_text(f"Error fetching data: {response_data['error']['message']}")
-            return
-        
-        # Extract the list of NFTs
-        items = response_data.get('result', {}).get('items', [])
-        if not items:
-            await update.message.reply_text(f"No NFT collections found for wallet address: {wallet_address}")
+        chunker = MessageChunker(limit=4000)
+
+        cached = assets_cache.get(wallet_address)
+        if cached is not None:
+            collections, is_stale = cached
+            # Serve the stale listing right away and refresh it in the background
+            if is_stale:
+                assets_cache.refresh(wallet_address, lambda: load_wallet_collections(wallet_address))
+            for name, collection_address in collections:
+                ready = chunker.add(format_nft(name, collection_address))
+                if ready:
+                    await send_bulk(context, update.effective_chat.id, ready)
         else:
-            # Split long responses into multiple messages
-            collections_list = ""
-            for item in items:
-                # Extracting data
-                name = item.get('content', {}).get('metadata', {}).get('name', 'Unnamed NFT')
-                description = item.get('content', {}).get('metadata', {}).get('description', 'No description available')
-                image_url = item.get('content', {}).get('links', {}).get('image', 'No image URL available')
-                group_value = next((group['group_value'] for group in item.get('grouping', []) if group.get('group_key') == 'collection'), None)
-
-                # Filter out items without a collection address (group_value)
-                if not group_value:
-                    continue
-
-                # Format the output for each NFT
-                nft_info = (
-                    f"Name: {name}\n"
-                    f"Collection Address: {group_value}\n\n"
-                )
-
-                # Check if the current message exceeds the limit
-                if len(collections_list) + len(nft_info) > 4000:
-                    await update.message.reply_text(collections_list)
-                    collections_list = ""
+            # Stream every page of the wallet and send each chunk as soon as it fills
+            collections = []
+            try:
+                async for item in helius_client.iter_assets_by_owner(wallet_address):
+                    reduced = reduce_asset(item)
+                    if not reduced:
+                        continue
+                    collections.append(reduced)
+
+                    ready = chunker.add(format_nft(*reduced))
+                    if ready:
+                        await send_bulk(context, update.effective_chat.id, ready)
+            except HeliusError as e:
+                await update.message.reply_text(f"Error fetching data: {e}")
+                return
+            assets_cache.set(wallet_address, collections)
+
+        if not collections:
+            await update.message.reply_text(f"No NFT collections found for wallet address: {wallet_address}")
+            return
 
-                collections_list += nft_info
-            
-            # Send the last accumulated message
-            if collections_list:
-                await update.message.reply_text(collections_list)
+        # Send the last accumulated message
+        remaining = chunker.flush()
+        if remaining:
+            await send_bulk(context, update.effective_chat.id, remaining)
     except Exception as e:
         logging.error(f"Error processing /fetch command: {e}")
         await update.message.reply_text("Sorry, there was an error fetching NFT collections. Please try again later.")
@@ -167,8 +304,7 @@ async def magic(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if update.effective_chat.username:
             return await update.message.reply_text("This command can only be used in private groups. use /start to know more")
 
-        chat_member = await context.bot.get_chat_member(update.effective_chat.id, update.message.from_user.id)
-        if chat_member.status not in ['creator', 'administrator']:
+        if not await admin_cache.is_admin(context.bot, update.effective_chat.id, update.message.from_user.id):
             return await update.message.reply_text("Sorry, only administrators and the group owner can use this command.")
 
         # Get arguments provided with the command
@@ -178,15 +314,17 @@ async def magic(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         collectionAddress = ' '.join(args)
 
-        groups_collection.insert_one({
-            'keyChatId': update.effective_chat.id,
+        # Re-running /magic in the same chat updates the existing registration
+        created = await groups_repo.upsert_group(update.effective_chat.id, collectionAddress, {
             'keyChatUserId': update.message.from_user.id,
             'keyChatName': update.effective_chat.title,
             'keyChatType': update.effective_chat.type,
-            'keyCollectionAddress': collectionAddress,
             'keyGatingType': 'NFTCollection',
-            'keyTimestamp': str(update.message.date.timestamp())
+        }, {
+            'keyTimestamp': update.message.date
         })
+        if created:
+            await group_stats_repo.record_group_created(collectionAddress, 'NFTCollection', update.message.date)
 
         blink_url = f"https://blinktochat.fun/{update.effective_chat.id}/{collectionAddress}"
         chat_title = update.effective_chat.title
@@ -220,42 +358,66 @@ async def stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         args = context.args
         collection_address = ' '.join(args) if args else None
 
-        if collection_address:
-            # Fetch data for the specific collection address
-            groups = list(groups_collection.find({'keyCollectionAddress': collection_address}))
+        chunker = MessageChunker(limit=4000)
 
-            if not groups:
+        async def add_block(text):
+            ready = chunker.add(text)
+            if ready:
+                await send_bulk(context, update.effective_chat.id, ready)
+
+        if collection_address:
+            # Stream the groups for the specific collection address, newest first
+            collection_stats = await group_stats_repo.read_collection(collection_address)
+            total = collection_stats.get('groupCount', 0) if collection_stats else 0
+            if not total:
                 return await update.message.reply_text(f"No groups found gated with collection address: {collection_address}")
 
-            stats_message = f"Groups gated with collection address {collection_address}:\n\n"
-            for group in groups:
-                stats_message += f"Chat Name: {group.get('keyChatName', 'Unknown')}\n"
-                stats_message += f"Gating Type: {group.get('keyGatingType', 'Unknown')}\n"
+            await add_block(f"{total} group(s) gated with collection address {collection_address}:\n\n")
+            async for group in groups_repo.iter_by_collection_address(collection_address, limit=STATS_PAGE_LIMIT):
                 timestamp = group.get('keyTimestamp', 'Unknown')
-                stats_message += f"Created: {utilXtimeAgo(timestamp) if timestamp != 'Unknown' else 'Unknown'}\n\n"
-                stats_message += "-------------------\n\n"
+                await add_block(
+                    f"Chat Name: {group.get('keyChatName', 'Unknown')}\n"
+                    f"Gating Type: {group.get('keyGatingType', 'Unknown')}\n"
+                    f"Created: {utilXtimeAgo(timestamp) if timestamp != 'Unknown' else 'Unknown'}\n\n"
+                    "-------------------\n\n"
+                )
+            if total > STATS_PAGE_LIMIT:
+                await add_block(f"...and {total - STATS_PAGE_LIMIT} more.\n")
 
         else:
-            # Fetch all groups
-            groups = list(groups_collection.find({}, {'keyChatName': 1, 'keyCollectionAddress': 1}))
-
-            if not groups:
+            # Totals come from the materialized group_stats counters
+            global_stats = await group_stats_repo.read_global()
+            if not global_stats or not global_stats.get('totalGroups'):
                 return await update.message.reply_text("No gated groups found.")
+            top_collections = await group_stats_repo.read_top_collections(limit=STATS_TOP_COLLECTIONS)
+            recent_groups = await groups_repo.find_recent(limit=STATS_RECENT_LIMIT)
+            created_this_week = await groups_repo.count_created_since(datetime.now(timezone.utc) - timedelta(days=7))
 
-            stats_message = "All gated groups:\n\n"
-            for group in groups:
-                stats_message += f"Group: {group['keyChatName']}\n"
-                stats_message += f"Collection Address: {group['keyCollectionAddress']}\n\n"
+            await add_block(
+                f"Gated groups: {global_stats['totalGroups']}\n"
+                f"Created in the last 7 days: {created_this_week}\n\n"
+            )
+            await add_block("By gating type:\n" + "".join(
+                f"{gating_type}: {count}\n"
+                for gating_type, count in sorted(global_stats.get('byGatingType', {}).items(), key=lambda row: -row[1])
+                if count
+            ) + "\n")
+            await add_block("Top collections:\n" + "".join(
+                f"{row['keyCollectionAddress']}: {row['groupCount']} group(s)\n" for row in top_collections
+            ) + "\n")
+            await add_block("Recently created:\n\n")
+            for group in recent_groups:
                 timestamp = group.get('keyTimestamp', 'Unknown')
-                stats_message += f"Created: {utilXtimeAgo(timestamp) if timestamp != 'Unknown' else 'Unknown'}\n\n"
-                stats_message += "-------------------\n\n"
+                await add_block(
+                    f"Group: {group.get('keyChatName', 'Unknown')}\n"
+                    f"Collection Address: {group.get('keyCollectionAddress', 'Unknown')}\n"
+                    f"Created: {utilXtimeAgo(timestamp) if timestamp != 'Unknown' else 'Unknown'}\n\n"
+                    "-------------------\n\n"
+                )
 
-        # Split long messages if necessary
-        if len(stats_message) > 4096:
-            for i in range(0, len(stats_message), 4096):
-                await update.message.reply_text(stats_message[i:i+4096])
-        else:
-            await update.message.reply_text(stats_message)
+        remaining = chunker.flush()
+        if remaining:
+            await send_bulk(context, update.effective_chat.id, remaining)
 
     except Exception as e:
         logging.error(f"Error processing /stats command: {e}")
@@ -271,78 +433,223 @@ async def handle_member_join(update: Update, context: ContextTypes.DEFAULT_TYPE)
         username = new_member.username
         user_id = new_member.id
 
-        # Update the hasJoined status and telegramIdIp in the users_collection
-        users_collection = db['users']  # Assuming you have a users collection
-
-        # Define the update fields
-        update_fields = {
-            'keyHasJoined': True,
-            'keyTelegramId': user_id
-        }
-
-        # Check if the user has a username
-        if username:
-            user_record = users_collection.find_one({'keyUsername': username})
-        else:
-            user_record = users_collection.find_one({'keyTelegramId': user_id})
+        # Batched into periodic bulk writes unless write-behind is disabled
+        if join_buffer is not None:
+            join_buffer.add(username, user_id)
+            return
 
-        if user_record:
-            # Update the user's hasJoined status and telegramIdIp if the record is found
-            users_collection.update_one(
-                {'_id': user_record['_id']},
-                {'$set': update_fields}
-            )
+        # Update the user's hasJoined status and telegramId if the record is found
+        if await users_repo.mark_joined(username, user_id):
             logging.info(f"User {username or user_id} marked as joined in the database.")
         else:
             logging.info(f"User {username or user_id} joined but not found in the database.")
     else:
         # Handle other cases, like when members leave or change status
         logging.info("Chat member status change event received, not a join.")
+
+join_request_counters = {'approved': 0, 'declined': 0, 'leftPending': 0, 'errors': 0}
+
+async def find_holders(wallet_addresses, collection_addresses):
+    # The wallets holding at least one of the collections. Answered from the
+    # holder index where it can; the remaining pairs are verified with Helius
+    # in one batched call
+    holders = set()
+    unresolved = []
+    for wallet_address in set(wallet_addresses):
+        answers = [(collection_address, holder_index.holds(wallet_address, collection_address))
+                   for collection_address in collection_addresses]
+        if any(held for _, held in answers):
+            holders.add(wallet_address)
+        else:
+            unresolved.extend((wallet_address, collection_address) for collection_address, held in answers if held is None)
+    if unresolved:
+        owned = await helius_client.verify_ownership(unresolved)
+        holders.update(wallet_address for (wallet_address, _), held in owned.items() if held)
+    return holders
+
+async def find_ineligible(user_records, collection_addresses):
+    # Members keep access by having transacted, or by holding one of the
+    # chat's collections in their known wallet; returns the records that do neither
+    candidates = [user_record for user_record in user_records if not user_record.get('keyHasTransacted')]
+    holders = await find_holders(
+        [user_record['keyWalletAddress'] for user_record in candidates if user_record.get('keyWalletAddress')],
+        collection_addresses,
+    )
+    return [user_record for user_record in candidates if user_record.get('keyWalletAddress') not in holders]
+
+async def is_eligible(user_record, collection_addresses):
+    return bool(user_record) and not await find_ineligible([user_record], collection_addresses)
+
+async def refresh_holder_index(context: ContextTypes.DEFAULT_TYPE):
+    # Snapshots are renewed one interval before they expire, so lookups
+    # between two runs of this job never find them stale
+    collection_addresses = await groups_repo.find_gated_collections()
+    await holder_index.refresh_stale(helius_client, collection_addresses, refresh_before=HOLDER_REFRESH_INTERVAL)
+
+async def handle_join_request(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Gated chats admit members through join requests: members who transacted
+    # or whose known wallet holds one of the chat's collections are approved,
+    # known wallets holding none are declined. Requests from users without a
+    # known wallet can't be decided here and stay pending for the admins.
+    join_request = update.chat_join_request
+    chat_id = join_request.chat.id
+    user = join_request.from_user
+    try:
+        collection_addresses = await groups_repo.find_collection_addresses(chat_id)
+        if not collection_addresses:
+            # Not a gated chat, leave the request to the admins
+            return
+
+        user_record = await users_repo.find_member(chat_id, user.id, user.username)
+        if not user_record or (not user_record.get('keyHasTransacted') and not user_record.get('keyWalletAddress')):
+            join_request_counters['leftPending'] += 1
+            logging.info(f"Join request from {user.username or user.id} to {chat_id} left to the admins: no known wallet")
+            return
+        eligible = await is_eligible(user_record, collection_addresses)
+
+        if eligible:
+            await join_request.approve()
+            join_request_counters['approved'] += 1
+        else:
+            await join_request.decline()
+            join_request_counters['declined'] += 1
+        logging.info(f"Join request from {user.username or user.id} to {chat_id} {'approved' if eligible else 'declined'}")
+    except Exception as e:
+        join_request_counters['errors'] += 1
+        logging.error(f"Error processing join request from {user.id} to {chat_id}: {e}")
+
+async def resolve_asset_collection(asset_id):
+    cached = asset_collections_cache.get(asset_id)
+    if cached is not None:
+        return cached[0]
+    collection_address = await helius_client.get_asset_collection(asset_id)
+    asset_collections_cache.set(asset_id, collection_address)
+    return collection_address
+
+# Transfer webhook deliveries update the holder index and queue sellers
+transfer_pipeline = TransferPipeline(
+    holder_index, enforcement_queue, resolve_asset_collection, groups_repo.find_gated_collections)
+
+enforcement_counters = {'checked': 0, 'removed': 0, 'failed': 0}
+
+async def enforce_wallet(bot, wallet_address):
+    # Removes the wallet's members from every gated chat they no longer qualify for
+    for user_record in await users_repo.find_by_wallet(wallet_address):
+        chat_id, telegram_id = user_record.get('keyTgChatId'), user_record.get('keyTelegramId')
+        if chat_id is None or not telegram_id:
+            continue
+        collection_addresses = await groups_repo.find_collection_addresses(chat_id)
+        if not collection_addresses:
+            continue
+        enforcement_counters['checked'] += 1
+        if await is_eligible(user_record, collection_addresses):
+            continue
+        removed, failed = await ban_members(bot, chat_id, [telegram_id], concurrency=1)
+        enforcement_counters['removed'] += removed
+        enforcement_counters['failed'] += failed
+        logging.info(f"Enforcement: {'removed' if removed else 'could not remove'} {telegram_id} "
+                     f"({wallet_address}) from {chat_id}")
+
+async def track_admin_changes(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Keep the admin cache in step with promotions and demotions
+    admin_cache.apply_chat_member_update(update.chat_member)
+
 async def validate(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         await context.bot.send_chat_action(chat_id=update.effective_chat.id, action='typing')
 
         # Ensure the command is used in a group chat and by an admin
         chat = update.effective_chat
-        chat_member = await context.bot.get_chat_member(chat.id, update.message.from_user.id)
 
         if chat.type not in [Chat.GROUP, Chat.SUPERGROUP]:
             await update.message.reply_text("This command can only be used in group chats.")
             return
 
-        if chat_member.status not in ['creator', 'administrator']:
+        if not await admin_cache.is_admin(context.bot, chat.id, update.message.from_user.id):
             await update.message.reply_text("Only administrators can use this command.")
             return
 
-        # Query the database for users with hasTransacted set to false
-        non_transacted_users = users_collection.find({'keyTgChatId': chat.id, 'keyHasTransacted': False})
-
-        # Check if there are any non-transacted users
-        if non_transacted_users.count() == 0:
-            await update.message.reply_text("All members have transacted. No removals needed.")
+        # The sweep runs as a persisted background job that survives restarts;
+        # this message is edited with its progress
+        progress_message = await update.message.reply_text("Validation queued. Checking for members who have not transacted...")
+        if not await validation_jobs_repo.enqueue(chat.id, progress_message.message_id):
+            await progress_message.edit_text("A validation is already in progress for this chat.")
             return
-
-        # Process each user who hasn't transacted
-        removed_users = []
-        for user in non_transacted_users:
-            user_id = user['keyTelegramId']
-            try:
-                await context.bot.ban_chat_member(chat.id, user_id)
-                removed_users.append(user_id)
-            except BadRequest as e:
-                logging.error(f"Error removing user {user_id}: {e}")
-
-        # Provide feedback on the action taken
-        if removed_users:
-            await update.message.reply_text(f"Removed {len(removed_users)} user(s) who have not transacted.")
-            await update.message.reply_text(f"Users removed: {removed_users}")
-        else:
-            await update.message.reply_text("No users were removed. Some may already have left or cannot be removed.")
+        context.job_queue.run_once(run_validation_jobs, 0)
 
     except Exception as e:
         logging.error(f"Error processing /validate command: {e}")
         await update.message.reply_text("Sorry, there was an error processing the validation. Please try again later.")
      
+def validation_progress_text(removed, failed):
+    return f"Removing members who have not transacted...\nRemoved: {removed}, failed: {failed}"
+
+async def run_validation_jobs(context: ContextTypes.DEFAULT_TYPE):
+    # Claims queued or abandoned (lease expired) validation jobs, up to
+    # VALIDATE_MAX_JOBS at a time in this process
+    while len(running_validation_jobs) < VALIDATE_MAX_JOBS:
+        job = await validation_jobs_repo.claim(VALIDATION_WORKER_ID, VALIDATE_LEASE_SECONDS)
+        if job is None:
+            return
+        task = asyncio.create_task(process_validation_job(context.bot, job))
+        running_validation_jobs.add(task)
+        task.add_done_callback(running_validation_jobs.discard)
+
+async def process_validation_job(bot, job):
+    chat_id = job['keyChatId']
+    removed, failed, last_user_id = job['removed'], job['failed'], job['lastUserId']
+    progress = ProgressMessage(bot, chat_id, job['progressMessageId'], interval=VALIDATE_PROGRESS_INTERVAL)
+    try:
+        # Members with a known wallet that holds one of the chat's collections
+        # are spared; make sure the snapshots they are checked against are
+        # fresh, extending the lease after each since large collections take a while
+        collection_addresses = await groups_repo.find_collection_addresses(chat_id)
+        for collection_address in collection_addresses:
+            await holder_index.ensure_fresh(helius_client, collection_address)
+            await validation_jobs_repo.checkpoint(job['_id'], last_user_id, removed, failed, VALIDATE_LEASE_SECONDS)
+
+        # One pass over a projected cursor; checkpoint after every batch so a
+        # restart resumes after the last finished batch (re-banning part of a
+        # batch is harmless)
+        async for users in users_repo.iter_non_transacted(chat_id, last_user_id, VALIDATE_CHECKPOINT_EVERY):
+            async def report(batch_removed, batch_failed):
+                await progress.update(validation_progress_text(removed + batch_removed, failed + batch_failed))
+
+            # Every wallet in the batch is verified together
+            to_remove = [
+                user['keyTelegramId'] for user in await find_ineligible(users, collection_addresses)
+                if user.get('keyTelegramId')
+            ]
+
+            batch_removed, batch_failed = await ban_members(
+                bot, chat_id, to_remove,
+                concurrency=VALIDATE_BAN_CONCURRENCY, on_progress=report,
+            )
+            removed += batch_removed
+            failed += batch_failed
+            last_user_id = users[-1]['_id']
+            await validation_jobs_repo.checkpoint(job['_id'], last_user_id, removed, failed, VALIDATE_LEASE_SECONDS)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logging.error(f"Error processing validation job {job['_id']} for chat {chat_id}: {e}")
+        # Otherwise the job is retried once its lease expires
+        if job.get('attempts', 1) >= VALIDATE_MAX_ATTEMPTS:
+            await validation_jobs_repo.finish(job['_id'], 'failed')
+            await progress.finish("Sorry, there was an error processing the validation. Please try again later.")
+        return
+
+    await validation_jobs_repo.finish(job['_id'], 'done')
+    # Provide feedback on the action taken
+    if last_user_id is None:
+        # The very first batch was empty
+        await progress.finish("All members have transacted. No removals needed.")
+    elif removed:
+        await progress.finish(f"Removed {removed} user(s) who have not transacted."
+                              + (f" {failed} could not be removed." if failed else ""))
+    else:
+        await progress.finish("No users were removed. Some may already have left or cannot be removed.")
+
 async def set_commands(context: ContextTypes.DEFAULT_TYPE):
     commands = [
         BotCommand("start", "Start the bot and see the options"),
@@ -363,9 +670,122 @@ async def openBlink(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     reply_markup = InlineKeyboardMarkup(keyboard)
     await update.message.reply_text("Welcome! Click the button to open the web app:", reply_markup=reply_markup)
 
+update_counters = {'received': 0, 'unhandled': 0}
+
+async def count_received_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    update_counters['received'] += 1
+
+async def count_unhandled_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    update_counters['unhandled'] += 1
+
+async def log_metrics(context: ContextTypes.DEFAULT_TYPE):
+    received, unhandled = update_counters['received'], update_counters['unhandled']
+    logging.info(f"Updates: received={received} handled={received - unhandled} unhandled={unhandled}")
+    logging.info(f"Assets cache: {assets_cache.stats()}")
+    logging.info(f"Helius single-flight: {helius_client.single_flight.stats()}")
+    logging.info(f"Helius ownership verification: {helius_client.ownership_stats()}")
+    logging.info(f"Update processor: {context.application.update_processor.stats()}")
+    logging.info(f"Outbound rate limiter: {context.bot.rate_limiter.stats()}")
+    logging.info(f"Admin cache: {admin_cache.stats()}")
+    logging.info(f"Join requests: {join_request_counters}")
+    logging.info(f"Holder index: {holder_index.stats()}")
+    logging.info(f"Asset collections cache: {asset_collections_cache.stats()}")
+    logging.info(f"Enforcement: {enforcement_queue.stats()} {enforcement_counters}")
+    if join_buffer is not None:
+        logging.info(f"Join write-behind: {join_buffer.stats()}")
+
+async def post_init(application: Application) -> None:
+    # Idempotent index bootstrap; set ENV_MONGO_CHECK_QUERY_PLANS=1 to refuse
+    # to start when a hot query would fall back to a collection scan
+    if os.getenv('ENV_MONGO_ENSURE_INDEXES', '1') == '1':
+        await mongo_executor.run(ensure_indexes, db)
+    if os.getenv('ENV_MONGO_CHECK_QUERY_PLANS', '0') == '1':
+        await mongo_executor.run(check_query_plans, db)
+    # /stats reads materialized counters; seed them from the groups collection
+    # on the first start after upgrading. No updates are processed yet, so no
+    # registration can slip in between the count and the write.
+    if await group_stats_repo.read_global() is None:
+        await group_stats_repo.replace_all(await group_stats_repo.compute_from_groups())
+        logging.info("Seeded group_stats from the groups collection")
+    if join_buffer is not None:
+        join_buffer.start()
+    enforcement_queue.start(lambda wallet_address: enforce_wallet(application.bot, wallet_address))
+    if web_server is not None:
+        web_server.start()
+
+async def post_stop(application: Application) -> None:
+    # Interrupt running validation jobs and hand their leases back; they resume
+    # from the last checkpoint in whichever process claims them next
+    for task in running_validation_jobs:
+        task.cancel()
+    await asyncio.gather(*running_validation_jobs, return_exceptions=True)
+    await validation_jobs_repo.release(VALIDATION_WORKER_ID)
+    # Stop taking transfer events before the queue they feed
+    if web_server is not None:
+        await web_server.stop()
+    await enforcement_queue.stop()
+    # No more updates arrive after stop, so this flushes every buffered join
+    if join_buffer is not None:
+        await join_buffer.stop()
+
+async def post_shutdown(application: Application) -> None:
+    # Wait for in-flight Mongo calls before closing the client
+    mongo_executor.shutdown()
+    client.close()
+    await helius_client.aclose()
+
+async def run_webhook(application: Application) -> None:
+    # What Application.run_webhook does, except that updates arrive through
+    # web_server: PTB's own webhook server would take $PORT for itself
+    stop_signal = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop_signal.set)
+
+    await application.initialize()
+    try:
+        await post_init(application)
+        await application.bot.set_webhook(
+            url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            drop_pending_updates=DROP_PENDING_UPDATES,
+            allowed_updates=ALLOWED_UPDATES,
+        )
+        await application.start()
+        await stop_signal.wait()
+        # Stop taking updates before the application stops processing them
+        await web_server.stop()
+        await application.stop()
+        await post_stop(application)
+    finally:
+        if application.running:
+            await application.stop()
+        await application.shutdown()
+        await post_shutdown(application)
+
 def main():
     # Create the Application and pass it your bot's token.
-    application = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    # Different chats are handled in parallel, updates within one chat in order
+    update_processor = PerChatUpdateProcessor(
+        max_concurrent_updates=int(os.getenv('ENV_MAX_CONCURRENT_UPDATES', '32')),
+        max_pending_updates=int(os.getenv('ENV_MAX_PENDING_UPDATES', '1024')),
+        max_pending_per_chat=int(os.getenv('ENV_MAX_PENDING_PER_CHAT', '256')),
+    )
+    application = (
+        Application.builder()
+        .token(TELEGRAM_BOT_TOKEN)
+        .concurrent_updates(update_processor)
+        .rate_limiter(PriorityRateLimiter(
+            overall_max_rate=float(os.getenv('ENV_TG_OVERALL_MAX_RATE', '30')),
+            group_max_rate=float(os.getenv('ENV_TG_GROUP_MAX_RATE', '20')),
+            max_retries=int(os.getenv('ENV_TG_MAX_RETRIES', '3')),
+        ))
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # Create a JobQueue and set it up in the application
     job_queue = application.job_queue
@@ -373,6 +793,16 @@ def main():
     # Schedule the set_commands function to run every hour to ensure commands are set
     job_queue.run_repeating(set_commands, interval=3600, first=0)
 
+    # Pick up queued validation jobs, and resume ones interrupted by a crash or redeploy
+    job_queue.run_repeating(run_validation_jobs, interval=VALIDATE_POLL_INTERVAL, first=5)
+
+    # Keep holder snapshots of gated collections fresh
+    job_queue.run_repeating(refresh_holder_index, interval=HOLDER_REFRESH_INTERVAL, first=1)
+
+    # Periodically log cache and throughput counters
+    metrics_interval = int(os.getenv('ENV_METRICS_INTERVAL', '300'))
+    job_queue.run_repeating(log_metrics, interval=metrics_interval, first=metrics_interval)
+
     # Add handlers - if not the commands doesn't start
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("magic", magic))
@@ -381,14 +811,75 @@ def main():
     application.add_handler(CommandHandler("validate", validate))
     application.add_handler(CommandHandler("openblink", openBlink))
 
-    application.add_handler(MessageHandler(filters.Regex('Make the group private'), make_group_private))
+    # Exact text match for the keyboard button instead of a regex over every message
+    application.add_handler(MessageHandler(filters.Text(['Make the group private']), make_group_private))
     
      # Add ChatMemberHandler for handling member status changes
-    member_handler = ChatMemberHandler(handle_member_join, ChatMemberHandler.MY_CHAT_MEMBER)
+    member_handler = ChatMemberHandler(handle_member_join, ChatMemberHandler.CHAT_MEMBER)
     application.add_handler(member_handler)
+    application.add_handler(ChatMemberHandler(track_admin_changes, ChatMemberHandler.CHAT_MEMBER), group=1)
+
+    application.add_handler(ChatJoinRequestHandler(handle_join_request))
+
+    # Count every update before dispatch, and those no handler in group 0 took
+    application.add_handler(TypeHandler(Update, count_received_update), group=-1)
+    application.add_handler(TypeHandler(Update, count_unhandled_update))
 
     # Run the bot until you press Ctrl-C
-    application.run_polling()
+    if BOT_MODE == 'webhook':
+        # Telegram pushes updates to our HTTP port; the secret token is checked
+        # on every request so only Telegram can post updates
+        web_server.add_telegram_route(WEBHOOK_PATH, secret_token=WEBHOOK_SECRET, bot_application=application)
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling(drop_pending_updates=DROP_PENDING_UPDATES, allowed_updates=ALLOWED_UPDATES)
+
+def cli_ensure_indexes():
+    ensure_indexes(db)
+    check_query_plans(db)
+
+async def rebuild_group_stats(dry_run):
+    live = await group_stats_repo.read_all()
+    recomputed = await group_stats_repo.compute_from_groups()
+    differences = diff_group_stats(live, recomputed)
+    for stats_id, field, live_value, new_value in differences:
+        print(f"{stats_id} {field}: live={live_value!r} recomputed={new_value!r}")
+    print(f"{len(differences)} difference(s) across {len(recomputed)} stats document(s)")
+    if not dry_run:
+        await group_stats_repo.replace_all(recomputed)
+        print("group_stats rebuilt")
+
+def cli_rebuild_stats():
+    # python main.py rebuild-stats [--dry-run]
+    asyncio.run(rebuild_group_stats(dry_run='--dry-run' in sys.argv[2:]))
+    mongo_executor.shutdown()
+
+def cli_dedup_groups():
+    # Collapse duplicate registrations, then make the unique index and the
+    # materialized counters match the cleaned-up collection
+    collapsed, removed = dedup_groups(groups_collection)
+    print(f"Collapsed {collapsed} duplicated registration(s), removed {removed} document(s)")
+    ensure_indexes(db)
+    asyncio.run(rebuild_group_stats(dry_run=False))
+    mongo_executor.shutdown()
+
+def cli_migrate_timestamps():
+    # Converts legacy string keyTimestamp values to BSON dates
+    converted = migrate_timestamps(groups_collection)
+    print(f"Converted {converted} timestamp(s)")
+
+# Maintenance subcommands: python main.py <command>
+CLI_COMMANDS = {
+    'ensure-indexes': cli_ensure_indexes,
+    'rebuild-stats': cli_rebuild_stats,
+    'dedup-groups': cli_dedup_groups,
+    'migrate-timestamps': cli_migrate_timestamps,
+}
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    if len(sys.argv) > 1:
+        if sys.argv[1] not in CLI_COMMANDS:
+            sys.exit(f"Unknown command {sys.argv[1]!r}. Available: {', '.join(CLI_COMMANDS)}")
+        CLI_COMMANDS[sys.argv[1]]()
+    else:
+        main()
\ No newline at end of file
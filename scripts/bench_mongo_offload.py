@@ -0,0 +1,74 @@
+# Benchmark: p99 handler latency with N concurrent chats, calling pymongo
+# directly on the event loop vs. going through the async repository.
+#
+# The Mongo round-trip is simulated with a blocking sleep so the benchmark
+# runs without a database:
+#
+#   python scripts/bench_mongo_offload.py --chats 50 --latency-ms 40
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.mongoRepository import MongoExecutor, UserRepository
+
+
+class SlowCollection:
+    # Blocks the calling thread like a real pymongo round-trip would
+    def __init__(self, latency):
+        self.latency = latency
+
+    def find_one(self, query, projection=None, **kwargs):
+        time.sleep(self.latency)
+        return {'_id': 1, **query}
+
+
+def p99(samples):
+    samples = sorted(samples)
+    return samples[max(0, int(len(samples) * 0.99) - 1)]
+
+
+async def run(chats, handler):
+    # Every chat's update arrives at the same instant, so a handler's latency
+    # includes the time it spent waiting for the event loop
+    latencies = []
+    start = time.perf_counter()
+
+    async def one_chat(i):
+        await handler(i)
+        latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one_chat(i) for i in range(chats)))
+    return latencies, time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=40)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    collection = SlowCollection(args.latency_ms / 1000)
+
+    async def blocking_handler(i):
+        collection.find_one({'keyTgChatId': -i, 'keyTelegramId': i})
+
+    executor = MongoExecutor(max_workers=args.workers)
+    users_repo = UserRepository(collection, executor)
+
+    async def offloaded_handler(i):
+        await users_repo.find_member(-i, i)
+
+    for label, handler in (('before (sync pymongo)', blocking_handler), ('after (repository)', offloaded_handler)):
+        latencies, total = await run(args.chats, handler)
+        print(f"{label:24} chats={args.chats} p99={p99(latencies) * 1000:.1f}ms total={total * 1000:.1f}ms")
+
+    executor.shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
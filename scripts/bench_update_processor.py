@@ -0,0 +1,60 @@
+# Benchmark: update throughput as the number of concurrently active chats
+# grows, sequential processing vs. PerChatUpdateProcessor. Also checks that
+# updates within each chat were handled in arrival order.
+#
+#   python scripts/bench_update_processor.py --updates 400 --handler-ms 20
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.ext import SimpleUpdateProcessor
+
+from helpers.updateProcessor import PerChatUpdateProcessor
+
+
+async def run(processor, updates, handler_latency):
+    handled = {}
+
+    async def handle(update):
+        await asyncio.sleep(handler_latency)
+        handled.setdefault(update.effective_chat.id, []).append(update.update_id)
+
+    start = time.perf_counter()
+    async with processor:
+        # Mirrors Application: one task per update when processing concurrently
+        if processor.max_concurrent_updates > 1:
+            await asyncio.gather(*(processor.process_update(update, handle(update)) for update in updates))
+        else:
+            for update in updates:
+                await processor.process_update(update, handle(update))
+    elapsed = time.perf_counter() - start
+
+    in_order = all(ids == sorted(ids) for ids in handled.values())
+    return elapsed, in_order
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=400)
+    parser.add_argument('--handler-ms', type=float, default=20)
+    parser.add_argument('--max-concurrent', type=int, default=32)
+    args = parser.parse_args()
+
+    for chats in (1, 2, 4, 8, 16, 32, 64):
+        updates = [
+            SimpleNamespace(update_id=i, effective_chat=SimpleNamespace(id=i % chats))
+            for i in range(args.updates)
+        ]
+        sequential, _ = await run(SimpleUpdateProcessor(1), updates, args.handler_ms / 1000)
+        per_chat, in_order = await run(PerChatUpdateProcessor(args.max_concurrent), updates, args.handler_ms / 1000)
+        print(f"chats={chats:3} sequential={args.updates / sequential:7.1f} updates/s "
+              f"per-chat={args.updates / per_chat:7.1f} updates/s ordered={in_order}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,137 @@
+# Local stand-in for Helius: replays recorded enhanced-transaction webhook
+# payloads against the transfer endpoint, so the pipeline from webhook to
+# holder index to enforcement can be exercised without a live webhook.
+#
+# Against a running bot (started with ENV_HELIUS_WEBHOOK_AUTH set):
+#
+#   python scripts/replay_helius_webhook.py scripts/fixtures/helius_nft_transfers.json \
+#       --url http://127.0.0.1:$PORT/helius --auth "$ENV_HELIUS_WEBHOOK_AUTH" --now
+#
+# Fully offline, without Helius, Mongo or Telegram: the endpoint is served
+# in-process, assets resolve through a recorded asset -> collection map (whose
+# collections count as gated), snapshots go to a temporary directory, and
+# enforcement prints the wallets it would re-check:
+#
+#   python scripts/replay_helius_webhook.py scripts/fixtures/helius_nft_transfers.json \
+#       --offline --assets scripts/fixtures/helius_asset_collections.json
+#
+# With --dry-run nothing is sent; the NFT transfers the bot would extract
+# from each payload are printed instead.
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from helpers.enforcementQueue import EnforcementQueue
+from helpers.holderIndex import HolderIndex
+from helpers.transferEvents import extract_nft_transfers
+from helpers.transferPipeline import TransferPipeline
+from helpers.webhookServer import WebhookServer
+
+OFFLINE_AUTH = 'offline-replay'
+
+
+def load_payload(path, now):
+    with open(path) as f:
+        transactions = json.load(f)
+    if now:
+        # Recorded payloads are old; replay them as if they just happened
+        for transaction in transactions:
+            transaction['timestamp'] = int(time.time())
+    return transactions
+
+
+async def replay(payloads, url, auth, delay):
+    async with httpx.AsyncClient(timeout=30) as client:
+        for index, (path, transactions) in enumerate(payloads):
+            if index and delay:
+                await asyncio.sleep(delay)
+            start = time.perf_counter()
+            response = await client.post(url, json=transactions, headers={'Authorization': auth})
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            print(f"{path}: {response.status_code} in {elapsed_ms:.0f} ms {response.text}")
+
+
+async def replay_offline(payloads, args):
+    with open(args.assets) as f:
+        asset_collections = json.load(f)
+
+    async def resolve_collection(asset_id):
+        return asset_collections.get(asset_id)
+
+    async def load_gated_collections():
+        return set(asset_collections.values())
+
+    async def enforce(wallet_address):
+        print(f"enforcement: would re-check every chat membership of {wallet_address}")
+
+    with tempfile.TemporaryDirectory() as snapshot_dir:
+        holder_index = HolderIndex(snapshot_dir)
+        enforcement_queue = EnforcementQueue()
+        pipeline = TransferPipeline(holder_index, enforcement_queue, resolve_collection, load_gated_collections,
+                                    enforcement_delay=args.enforcement_delay)
+        server = WebhookServer(args.port, listen='127.0.0.1')
+        server.add_helius_route('helius', OFFLINE_AUTH, pipeline.process)
+        server.start()
+        enforcement_queue.start(enforce)
+        try:
+            await replay(payloads, f"http://127.0.0.1:{args.port}/helius", OFFLINE_AUTH, args.delay)
+            await enforcement_queue.join()
+        finally:
+            await server.stop()
+            await enforcement_queue.stop()
+
+        # None means unknown: the sender is re-verified live by the bot
+        for path, transactions in payloads:
+            for transfer in extract_nft_transfers(transactions):
+                collection_address = asset_collections.get(transfer.asset_id)
+                if collection_address is None:
+                    print(f"{path}: {transfer.asset_id} is not in {args.assets}, ignored")
+                    continue
+                for wallet in (transfer.from_wallet, transfer.to_wallet):
+                    if wallet:
+                        print(f"{path}: holds({wallet}, {collection_address}) = "
+                              f"{holder_index.holds(wallet, collection_address)}")
+        print(f"Holder index: {holder_index.stats()}")
+        print(f"Enforcement: {enforcement_queue.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('payloads', nargs='+', help='JSON files, each holding one webhook delivery')
+    parser.add_argument('--url', default='http://127.0.0.1:8000/helius')
+    parser.add_argument('--auth', help='the webhook auth header value (ENV_HELIUS_WEBHOOK_AUTH)')
+    parser.add_argument('--now', action='store_true', help='rewrite transaction timestamps to the current time')
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds between deliveries')
+    parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--offline', action='store_true', help='serve the pipeline in-process with recorded data')
+    parser.add_argument('--assets', default='scripts/fixtures/helius_asset_collections.json',
+                        help='asset id -> collection address map used with --offline')
+    parser.add_argument('--port', type=int, default=18081, help='local port used with --offline')
+    parser.add_argument('--enforcement-delay', type=float, default=0.0,
+                        help='seconds after a transfer before its sender is checked, with --offline')
+    args = parser.parse_args()
+    if not (args.dry_run or args.offline or args.auth):
+        parser.error('--auth is required unless --dry-run or --offline is given')
+
+    payloads = [(path, load_payload(path, args.now)) for path in args.payloads]
+    if args.dry_run:
+        for path, transactions in payloads:
+            for transfer in extract_nft_transfers(transactions):
+                print(f"{path}: {transfer.asset_id} {transfer.from_wallet} -> {transfer.to_wallet} "
+                      f"({transfer.signature})")
+    elif args.offline:
+        asyncio.run(replay_offline(payloads, args))
+    else:
+        asyncio.run(replay(payloads, args.url, args.auth, args.delay))
+
+
+if __name__ == '__main__':
+    main()
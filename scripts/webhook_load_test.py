@@ -0,0 +1,75 @@
+# Local load test for webhook mode: posts synthetic Telegram updates to the
+# bot's webhook endpoint and reports throughput and latency.
+#
+# Start the bot with ENV_BOT_MODE=webhook, then:
+#
+#   python scripts/webhook_load_test.py --url http://127.0.0.1:8000/telegram \
+#       --secret "$ENV_WEBHOOK_SECRET" --updates 2000 --concurrency 50
+#
+# The synthetic updates are plain group messages from many chats, which go
+# through the full ingress and dispatch path without calling the Bot API.
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+
+def synthetic_update(update_id, chats):
+    chat_id = -1000000000000 - (update_id % chats)
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'supergroup', 'title': f'Load test {chat_id}'},
+            'from': {'id': 100000 + update_id % 5000, 'is_bot': False, 'first_name': 'Load'},
+            'text': f'load test message {update_id}',
+        },
+    }
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[max(0, int(len(samples) * fraction) - 1)]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:8000/telegram')
+    parser.add_argument('--secret', required=True)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--chats', type=int, default=100)
+    args = parser.parse_args()
+
+    headers = {'X-Telegram-Bot-Api-Secret-Token': args.secret}
+    latencies = []
+    statuses = Counter()
+    next_id = iter(range(1, args.updates + 1))
+
+    async def worker(client):
+        for update_id in next_id:
+            start = time.perf_counter()
+            try:
+                response = await client.post(args.url, json=synthetic_update(update_id, args.chats), headers=headers)
+                statuses[response.status_code] += 1
+            except httpx.HTTPError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - start)
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - start
+
+    print(f"updates={args.updates} concurrency={args.concurrency} elapsed={elapsed:.2f}s "
+          f"throughput={args.updates / elapsed:.1f} updates/s")
+    print(f"latency p50={percentile(latencies, 0.5) * 1000:.1f}ms p99={percentile(latencies, 0.99) * 1000:.1f}ms")
+    print(f"responses: {dict(statuses)}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())